@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Startup benchmark for the VFF token scripts.
+Times `<script> --help` and checks that SDK and pandas imports stay off the startup path.
+Exits with status 1 if a script loads a heavy module or exceeds the time budget.
+"""
+import sys
+import os
+import argparse
+import subprocess
+import statistics
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ["generate_token.py", "generate_token_sase.py"]
+HEAVY_MODULES = ["cloudgenix", "prisma_sase", "pandas", "requests", "numpy", "pyarrow"]
+
+# Runs a script's --help in-process and prints the heavy modules it imported
+CHECK_IMPORTS = """
+import runpy, sys
+sys.argv = [{script!r}, "--help"]
+sys.stdout = open("{devnull}", "w")
+try:
+    runpy.run_path({script!r}, run_name="__main__")
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def time_help(script, runs):
+    """
+    :return: List of wall clock times in ms for `python <script> --help`
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, "--help"], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def heavy_imports(script):
+    code = CHECK_IMPORTS.format(script=script, devnull=os.devnull, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return [name for name in output.strip().split(",") if name]
+
+
+def go():
+    parser = argparse.ArgumentParser(description="VFF token script startup benchmark.")
+    parser.add_argument("--runs", "-R", help="Number of timed runs per script", type=int, default=10)
+    parser.add_argument("--budget_ms", "-B", help="Maximum median startup time in ms", type=float, default=150.0)
+    args = vars(parser.parse_args())
+
+    # Baseline: bare interpreter startup
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    print("INFO: Interpreter startup: {:.1f} ms".format((time.perf_counter() - start) * 1000))
+
+    failed = False
+    for script in SCRIPTS:
+        timings = time_help(script, args["runs"])
+        median = statistics.median(timings)
+        print("INFO: {} --help: median {:.1f} ms, min {:.1f} ms, max {:.1f} ms over {} runs".format(
+            script, median, min(timings), max(timings), len(timings)))
+        if median > args["budget_ms"]:
+            print("ERR: {} startup exceeds budget of {:.0f} ms".format(script, args["budget_ms"]))
+            failed = True
+
+        loaded = heavy_imports(script)
+        if loaded:
+            print("ERR: {} imports {} before they are needed".format(script, ", ".join(loaded)))
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    go()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark for generate_token_sase.py against the mock controller.
+Reports tokens/sec, per-call p50/p95/p99 latency and peak memory for each tenant count.
+"""
+import sys
+import os
+import argparse
+import contextlib
+import importlib.util
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_controller
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def load_script(name):
+    """
+    Load a script as a fresh module so each run starts from clean module state
+    """
+    spec = importlib.util.spec_from_file_location(name.replace(".py", ""), os.path.join(ROOT, name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_sase(controller, tenants, num, workers, extra_args):
+    """
+    Run generate_token_sase.go() for the given number of tenants in a temporary directory.
+    :return: Dict with elapsed seconds, tokens created and peak traced memory in bytes
+    """
+    workdir = tempfile.mkdtemp(prefix="vffbench")
+    cwd = os.getcwd()
+    argv = sys.argv
+    replaced = mock_controller.install(controller)
+    try:
+        os.chdir(workdir)
+        with open("tenants.csv", "w") as f:
+            f.write("tsg_id,name\n")
+            for index in range(tenants):
+                f.write("{},tenant{}\n".format(1000000000 + index, index))
+
+        script = load_script("generate_token_sase.py")
+        sys.argv = ["generate_token_sase.py", "-CI", "client", "-CS", "secret", "-CT", "1",
+                    "-M", "3102", "-U", "single", "-F", "tenants.csv", "-N", str(num),
+                    "-W", str(workers), "-O", "vffdata.csv"] + extra_args
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            try:
+                script.go()
+            except SystemExit:
+                pass
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        with open("vffdata.csv") as f:
+            created = sum(1 for _ in f) - 1
+    finally:
+        sys.argv = argv
+        os.chdir(cwd)
+        mock_controller.uninstall(replaced)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {"elapsed": elapsed, "tokens": created, "peak": peak}
+
+
+def go():
+    parser = argparse.ArgumentParser(description="VFF token throughput benchmark against a mock controller.")
+    parser.add_argument("--tenants", help="Comma separated tenant counts", default="1,100,1000")
+    parser.add_argument("--num", "-N", help="Tokens per tenant", type=int, default=1)
+    parser.add_argument("--workers", "-W", help="Tenants processed in parallel", type=int, default=8)
+    parser.add_argument("--latency_ms", help="Mean mock controller latency per call", type=float, default=20.0)
+    parser.add_argument("--jitter_ms", help="Standard deviation of mock latency", type=float, default=5.0)
+    parser.add_argument("--error_rate", help="Fraction of calls failing with --error_status", type=float, default=0.0)
+    parser.add_argument("--error_status", help="Status for injected errors", type=int, default=429)
+    parser.add_argument("--allowed_ions", help="Licenses per model per tenant", type=int, default=1000)
+    args, extra_args = parser.parse_known_args()
+    args = vars(args)
+
+    print("{:>8} {:>8} {:>9} {:>11} {:>10}  {}".format("tenants", "tokens", "seconds", "tokens/sec", "peak MiB",
+                                                        "endpoint p50/p95/p99 ms (calls)"))
+    for tenants in [int(count) for count in args["tenants"].split(",")]:
+        controller = mock_controller.MockController(latency_ms=args["latency_ms"], jitter_ms=args["jitter_ms"],
+                                                    error_rate=args["error_rate"],
+                                                    error_status=args["error_status"],
+                                                    allowed_ions=args["allowed_ions"], seed=tenants)
+        result = run_sase(controller, tenants, args["num"], args["workers"], extra_args)
+        latencies = []
+        for endpoint in sorted(controller.calls):
+            timings = [timing * 1000 for timing in controller.calls[endpoint]]
+            latencies.append("{} {:.1f}/{:.1f}/{:.1f} ({})".format(endpoint, percentile(timings, 50),
+                                                                   percentile(timings, 95),
+                                                                   percentile(timings, 99), len(timings)))
+
+        print("{:>8} {:>8} {:>9.2f} {:>11.1f} {:>10.2f}  {}".format(
+            tenants, result["tokens"], result["elapsed"], result["tokens"] / result["elapsed"],
+            result["peak"] / (1024.0 * 1024.0), "; ".join(latencies)))
+
+
+if __name__ == "__main__":
+    go()
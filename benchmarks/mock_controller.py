@@ -0,0 +1,286 @@
+"""
+In-process stand-in for the VFF endpoints used by the token scripts.
+install() registers fake `prisma_sase` and `cloudgenix` modules so the scripts run against it without
+touching a real controller or consuming licenses.
+"""
+import datetime
+import sys
+import random
+import threading
+import time
+import types
+import uuid
+
+DEFAULT_MODELS = ["ion 3102v", "ion 3104v", "ion 3108v", "ion 7108v", "ion 7116v"]
+
+# Lifetime of the access tokens handed out by login, as for Prisma SASE
+TOKEN_TTL = 900
+
+
+class MockResponse(object):
+    """
+    Mimics the requests.Response returned by the SDKs, with cgx_status and cgx_content set.
+    """
+
+    def __init__(self, status_code, content=None, headers=None):
+        self.status_code = status_code
+        self.cgx_status = 200 <= status_code < 300
+        self.cgx_content = content if content is not None else {}
+        self.headers = headers or {}
+
+    def __repr__(self):
+        return "<MockResponse [{}]>".format(self.status_code)
+
+
+class MockController(object):
+    """
+    Shared controller state for all tenants and SDK sessions.
+    :param latency_ms: Mean latency added to every call
+    :param jitter_ms: Standard deviation of the added latency
+    :param error_rate: Fraction of calls that fail with error_status
+    :param error_status: Status returned for injected errors, 429 or 5xx
+    :param allowed_ions: Licenses per model for every tenant
+    :param deployed_ions: Licenses per model already in use for every tenant
+    :param consume_on_mint: Count each token created against the license, so quotas run out
+    :param children: Child TSG IDs returned by the Tenancy API list_children call
+    """
+
+    def __init__(self, latency_ms=20.0, jitter_ms=5.0, error_rate=0.0, error_status=429, allowed_ions=1000,
+                 deployed_ions=0, models=None, consume_on_mint=True, seed=None, children=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.allowed_ions = allowed_ions
+        self.deployed_ions = deployed_ions
+        self.models = list(models or DEFAULT_MODELS)
+        self.consume_on_mint = consume_on_mint
+        self.children = list(children or [])
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._licenses = {}
+        self.tokens = {}
+        self.calls = {}
+
+    def _latency(self):
+        with self._lock:
+            delay = self._random.gauss(self.latency_ms, self.jitter_ms)
+            failed = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        return failed
+
+    def _record(self, endpoint, start):
+        with self._lock:
+            self.calls.setdefault(endpoint, []).append(time.perf_counter() - start)
+
+    def _tenant_licenses(self, tenant_id):
+        with self._lock:
+            if tenant_id not in self._licenses:
+                self._licenses[tenant_id] = [{
+                    "id": "{}-{}".format(tenant_id, index),
+                    "model": model,
+                    "allowed_ions": self.allowed_ions,
+                    "deployed_ions": self.deployed_ions
+                } for index, model in enumerate(self.models)]
+            return self._licenses[tenant_id]
+
+    def request(self, endpoint, tenant_id, handler):
+        """
+        Apply latency and error injection, then run handler() to build the response content.
+        """
+        start = time.perf_counter()
+        try:
+            if self._latency():
+                return MockResponse(self.error_status, {"_error": [{"code": "MOCK", "message": "Injected error"}]})
+            return handler()
+        finally:
+            self._record(endpoint, start)
+
+    def login(self, tenant_id):
+        return self.request("login", tenant_id, lambda: MockResponse(200, {"access_token": uuid.uuid4().hex}))
+
+    def vfflicenses(self, tenant_id):
+        def handler():
+            items = [dict((k, v) for k, v in license.items() if k != "deployed_ions")
+                     for license in self._tenant_licenses(tenant_id)]
+            return MockResponse(200, {"items": items})
+        return self.request("vfflicenses", tenant_id, handler)
+
+    def vfflicense_status(self, tenant_id, vfflicense_id):
+        def handler():
+            for license in self._tenant_licenses(tenant_id):
+                if license["id"] == vfflicense_id:
+                    with self._lock:
+                        return MockResponse(200, {"id": vfflicense_id, "deployed_ions": license["deployed_ions"]})
+            return MockResponse(404)
+        return self.request("vfflicense_status", tenant_id, handler)
+
+    def tokens_vfflicenses(self, tenant_id, vfflicense_id, data):
+        def handler():
+            for license in self._tenant_licenses(tenant_id):
+                if license["id"] == vfflicense_id:
+                    with self._lock:
+                        if license["deployed_ions"] >= license["allowed_ions"]:
+                            return MockResponse(400, {"_error": [{"code": "LICENSE_EXHAUSTED"}]})
+                        if self.consume_on_mint:
+                            license["deployed_ions"] += 1
+                        token = dict(data, id=uuid.uuid4().hex, vfflicense_id=vfflicense_id,
+                                     ion_key=uuid.uuid4().hex, secret_key=uuid.uuid4().hex,
+                                     _created_on_utc=int(time.time() * 1e7))
+                        self.tokens.setdefault(vfflicense_id, []).append(token)
+                        return MockResponse(200, token)
+            return MockResponse(404)
+        return self.request("tokens_vfflicenses", tenant_id, handler)
+
+    def tokens_vfflicenses_query(self, tenant_id, data):
+        def handler():
+            license_id = data.get("query_params", {}).get("vfflicense_id", {}).get("eq", None)
+            limit = data.get("limit", 100)
+            start = (data.get("dest_page", 1) - 1) * limit
+            with self._lock:
+                items = list(self.tokens.get(license_id, []))
+            return MockResponse(200, {"total_count": len(items), "items": items[start:start + limit]})
+        return self.request("tokens_vfflicenses_query", tenant_id, handler)
+
+    def update_token(self, tenant_id, vfflicense_id, token_id, data):
+        def handler():
+            with self._lock:
+                for token in self.tokens.get(vfflicense_id, []):
+                    if token["id"] == token_id:
+                        if data.get("is_revoked") and not token.get("is_revoked") and self.consume_on_mint:
+                            for license in self._licenses.get(tenant_id, []):
+                                if license["id"] == vfflicense_id:
+                                    license["deployed_ions"] -= 1
+                        token.update(data)
+                        return MockResponse(200, dict(token))
+            return MockResponse(404)
+        return self.request("tokens_vfflicenses_update", tenant_id, handler)
+
+    def list_children(self, tenant_id):
+        def handler():
+            return MockResponse(200, {"items": [{"id": child, "display_name": child} for child in self.children]})
+        return self.request("list_children", tenant_id, handler)
+
+    def token_count(self):
+        with self._lock:
+            return sum(len(tokens) for tokens in self.tokens.values())
+
+
+class _Session(object):
+    def __init__(self):
+        self.headers = {}
+
+
+class MockAPI(object):
+    """
+    Mimics the prisma_sase / cloudgenix API class for the calls made by the scripts.
+    """
+    controller_state = None
+
+    def __init__(self, controller=None, ssl_verify=True):
+        self.controller = controller or "https://mock.controller"
+        self.version = "mock"
+        self.tenant_id = None
+        self._session = _Session()
+        self.interactive = _Interactive(self)
+        self.get = _Get(self)
+        self.post = _Post(self)
+        self.put = _Put(self)
+
+    def set_debug(self, level):
+        pass
+
+    def add_headers(self, headers):
+        self._session.headers.update(headers)
+
+    def rest_call(self, url, method, data=None):
+        if method.lower() == "get" and "/operations/list_children" in url:
+            return self.controller_state.list_children(self.tenant_id)
+        return MockResponse(404)
+
+
+class _Interactive(object):
+    def __init__(self, parent):
+        self._parent = parent
+
+    def login_secret(self, client_id=None, client_secret=None, tsg_id=None):
+        resp = self._parent.controller_state.login(tsg_id)
+        if resp.cgx_status:
+            self._parent.add_headers({"Authorization": "Bearer {}".format(resp.cgx_content["access_token"])})
+            self._parent.tenant_id = tsg_id
+            self._parent.jwt_expires_at = datetime.datetime.now() + datetime.timedelta(seconds=TOKEN_TTL)
+            return True
+        return False
+
+    def login(self, email=None, password=None):
+        resp = self._parent.controller_state.login("cgx-tenant")
+        if resp.cgx_status:
+            self._parent.tenant_id = "cgx-tenant"
+            return True
+        return False
+
+    def use_token(self, token=None):
+        self._parent.tenant_id = "cgx-tenant"
+        return True
+
+
+class _Get(object):
+    def __init__(self, parent):
+        self._parent = parent
+
+    def vfflicenses(self):
+        return self._parent.controller_state.vfflicenses(self._parent.tenant_id)
+
+    def vfflicense_status(self, vfflicense_id):
+        return self._parent.controller_state.vfflicense_status(self._parent.tenant_id, vfflicense_id)
+
+    def logout(self):
+        return MockResponse(200)
+
+
+class _Post(object):
+    def __init__(self, parent):
+        self._parent = parent
+
+    def tokens_vfflicenses(self, vfflicense_id, data):
+        return self._parent.controller_state.tokens_vfflicenses(self._parent.tenant_id, vfflicense_id, data)
+
+    def vff_token_query(self, data):
+        return self._parent.controller_state.tokens_vfflicenses_query(self._parent.tenant_id, data)
+
+
+class _Put(object):
+    def __init__(self, parent):
+        self._parent = parent
+
+    def vfflicense_tokens(self, vfflicense_id, token_id, data):
+        return self._parent.controller_state.update_token(self._parent.tenant_id, vfflicense_id, token_id, data)
+
+
+def jd_detailed(resp):
+    pass
+
+
+def install(controller):
+    """
+    Register fake prisma_sase and cloudgenix modules backed by controller.
+    :return: Dict of the modules that were replaced, for uninstall()
+    """
+    api = type("API", (MockAPI,), {"controller_state": controller})
+    replaced = {}
+    for name in ["prisma_sase", "cloudgenix"]:
+        module = types.ModuleType(name)
+        module.API = api
+        module.jd_detailed = jd_detailed
+        replaced[name] = sys.modules.get(name, None)
+        sys.modules[name] = module
+    return replaced
+
+
+def uninstall(replaced):
+    for name, module in replaced.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
@@ -6,19 +6,20 @@ tkamath@paloaltonetworks.com
 import sys
 import os
 import argparse
-import cloudgenix
+import collections
+import datetime
+import time
 
 SCRIPT_NAME = "Generate VFF Tokens"
 SCRIPT_VERSION = "v1.0"
 
 
-# Import CloudGenix Python SDK
-try:
-    import cloudgenix
-except ImportError as e:
-    cloudgenix = None
-    sys.stderr.write("ERROR: 'cloudgenix' python module required. (try 'pip install cloudgenix').\n {0}\n".format(e))
-    sys.exit(1)
+# CloudGenix Python SDK, imported by import_sdk() once arguments are validated
+cloudgenix = None
+
+from vfftoken import CallScheduler, Metrics, TokenMinter, TokenSink, INFLIGHT
+from vfftoken import MultiSink, STORE_KEY_ENV, TokenStore, store_cipher
+from vfftoken import Profiler, NO_PROFILE
 
 # Check for cloudgenix_settings.py config file in cwd.
 sys.path.append(os.getcwd())
@@ -55,47 +56,35 @@ else:
     binary_type = bytes
 
 
+def import_sdk():
+    """
+    Import CloudGenix Python SDK. Deferred so --help and argument errors do not pay the SDK import cost.
+    :return: No return
+    """
+    global cloudgenix
+    try:
+        import cloudgenix
+    except ImportError as e:
+        cloudgenix = None
+        sys.stderr.write("ERROR: 'cloudgenix' python module required. (try 'pip install cloudgenix').\n {0}\n".format(e))
+        sys.exit(1)
+
+
+def print_phases(profiler):
+    """
+    Print the wall-clock time spent in each profiled phase
+    :return: No return
+    """
+    for name, (count, seconds) in sorted(profiler.phases().items(), key=lambda item: -item[1][1]):
+        print("INFO: Phase {}: {:.3f}s{}".format(name, seconds, " over {} spans".format(count) if count > 1 else ""))
+
+
 def cleanexit(cgx_session):
     print("INFO: Logging Out")
     cgx_session.get.logout()
     sys.exit()
 
 
-ionmodel_licensecount_dict = {}
-ionmodel_licenseid_dict = {}
-ionmodel_deployedcount_dict = {}
-ionmodel_availablecount_dict = {}
-def get_license_usage(cgx_session):
-    #
-    # Retrive VFF License count for each ION models
-    #
-    resp = cgx_session.get.vfflicenses()
-    if resp.cgx_status:
-        licenselist = resp.cgx_content.get("items", None)
-
-        for license in licenselist:
-            ionmodel_licensecount_dict[license["model"]] = license["allowed_ions"]
-            ionmodel_licenseid_dict[license["model"]] = license["id"]
-
-            #
-            # Get usage information
-            #
-            resp = cgx_session.get.vfflicense_status(license["id"])
-            if resp.cgx_status:
-                deployed_count = resp.cgx_content.get("deployed_ions")
-                ionmodel_deployedcount_dict[license["model"]] = deployed_count
-                available_count = license["allowed_ions"] - deployed_count
-                ionmodel_availablecount_dict[license["model"]] = available_count
-
-            else:
-                print("ERR: Could not retrieve VFF License Status for model {}".format(license["model"]))
-                cloudgenix.jd_detailed(resp)
-
-    else:
-        print("ERR: Could not retrieve VFF Licenses")
-        cloudgenix.jd_detailed(resp)
-
-
 model_map = {
     "3102": "ion 3102v",
     "3104": "ion 3104v",
@@ -115,6 +104,7 @@ def go():
     #############################################################################
     # Begin Script, parse arguments.
     ############################################################################
+    started = time.perf_counter()
 
     # Parse arguments
     parser = argparse.ArgumentParser(description="{0}.".format(SCRIPT_NAME))
@@ -125,6 +115,12 @@ def go():
                                   help="Controller URI, ex. "
                                        "C-Prod: https://api.elcapitan.cloudgenix.com",
                                   default=None)
+    controller_group.add_argument("--rate", help="Maximum controller calls per second. 0 for no limit",
+                                  type=float, default=0)
+    controller_group.add_argument("--max_retries", help="Number of retries for throttled or failed controller calls",
+                                  type=int, default=5)
+    controller_group.add_argument("--inflight", help="Token requests in flight at a time",
+                                  type=int, default=INFLIGHT)
 
     login_group = parser.add_argument_group('Login', 'These options allow skipping of interactive login')
     login_group.add_argument("--email", "-E", help="Use this email as User Name instead of prompting",
@@ -136,12 +132,31 @@ def go():
     debug_group = parser.add_argument_group('Debug', 'These options enable debugging output')
     debug_group.add_argument("--sdkdebug", "-D", help="Enable SDK Debug output, levels 0-2", type=int,
                              default=0)
+    debug_group.add_argument("--metrics_out", help="Write call timings and counters to <prefix>.json and a "
+                                                   "Prometheus textfile <prefix>.prom",
+                             default=None)
+    debug_group.add_argument("--profile", help="Profile the run. Writes cProfile stats to <prefix>.prof and the time "
+                                               "spent in each phase to <prefix>.trace.json, for a flamegraph or "
+                                               "trace viewer",
+                             default=None)
 
     # Config Settings
     config_group = parser.add_argument_group('Config', 'These options are to provide VFF license parameters')
-    config_group.add_argument("--model_name", "-M", help="Choose the ION model for license generation. Allowed values: 3102, 3104, 3108, 7108, 7116, 7132", default="3102")
+    config_group.add_argument("--model_name", "-M", help="Choose the ION model for license generation. Allowed values: 3102, 3104, 3108, 7108, 7116, 7132. "
+                                                         "Comma separated for more than one model, ex. 3102,3104", default="3102")
     config_group.add_argument("--type", "-T", help="Single or Multi use token. Allowed values: single or multi",
                               default="multi")
+    config_group.add_argument("--num", "-N", help="Number of tokens to generate per model", type=int,
+                              default=1)
+    config_group.add_argument("--output", "-O", help="File to save VFF Keys & Secrets to. Default: printed only, or "
+                                                     "vffdata_<time>.csv when more than one token is generated",
+                              default=None)
+    config_group.add_argument("--format", help="Output file format. Allowed values: csv or jsonl. Default: from the "
+                                               "output file extension, else csv",
+                              default=None)
+    config_group.add_argument("--db", help="SQLite token store to save VFF Keys & Secrets to, with secrets encrypted "
+                                           "by the key in {}. Replaces the default output file".format(STORE_KEY_ENV),
+                              default=None)
 
     ############################################################################
     # Parse arguments provided via CLI
@@ -150,6 +165,10 @@ def go():
     sdk_debuglevel = args["sdkdebug"]
     model_name = args["model_name"]
     type = args["type"]
+    num = args["num"]
+    vfffilename = args["output"]
+    output_format = args["format"]
+    dbfilename = args["db"]
 
     if type not in ["single", "multi"]:
         print("ERR: Invalid type. Please choose: single or multi")
@@ -160,14 +179,67 @@ def go():
     else:
         multiuse = "true"
 
-    if model_name not in ["3102", "3104", "3108", "7108", "7116", "7132"]:
+    model_names = [name.strip() for name in model_name.split(",") if name.strip()]
+    if not model_names or any(name not in ["3102", "3104", "3108", "7108", "7116", "7132"] for name in model_names):
         print("ERR: Invalid model_name. Please choose from: 3102, 3104, 3108, 7108, 7116, 7132")
         sys.exit()
 
-    ION_MODEL = model_map[model_name]
+    if num < 1:
+        print("ERR: Invalid num. Please provide a value of 1 or more")
+        sys.exit()
+
+    if args["inflight"] < 1:
+        print("ERR: Invalid inflight. Please provide a value of 1 or more")
+        sys.exit()
+
+    if args["rate"] < 0 or args["max_retries"] < 0:
+        print("ERR: Invalid rate or max_retries. Please provide a value of 0 or more")
+        sys.exit()
+
+    if output_format not in [None, "csv", "jsonl"]:
+        print("ERR: Invalid format. Please choose: csv or jsonl")
+        sys.exit()
+
+    # Repeated models are merged into one order
+    orders = collections.OrderedDict()
+    for name in model_names:
+        orders[model_map[name]] = orders.get(model_map[name], 0) + num
+
+    if dbfilename:
+        try:
+            store_cipher()
+        except ValueError as e:
+            print("ERR: {}".format(e))
+            sys.exit()
+
+    if vfffilename is None and dbfilename is None and (output_format or sum(orders.values()) > 1):
+        curtime_str = datetime.datetime.utcnow().strftime('%Y-%m-%d-%H-%M-%S')
+        vfffilename = "vffdata_{}.{}".format(curtime_str, output_format or "csv")
+
+    # Output left by an earlier run holds secrets that exist nowhere else
+    if vfffilename:
+        for existing in [vfffilename, "{}.partial".format(vfffilename)]:
+            if os.path.exists(existing):
+                print("ERR: {} already exists. Please choose another output file".format(existing))
+                sys.exit()
+
+    #
+    # Argument parsing is timed but not profiled, as the profiler only starts once the arguments are known
+    #
+    profiler = NO_PROFILE
+    if args["profile"]:
+        profiler = Profiler(origin=started)
+        profiler.add_span("parse", started, time.perf_counter())
+        profiler.start()
+
+    with profiler.span("import_sdk"):
+        import_sdk()
     ############################################################################
     # Instantiate API & Login
     ############################################################################
+    login_started = time.perf_counter()
+    metrics = Metrics()
+    scheduler = CallScheduler(rate=args["rate"], max_retries=args["max_retries"], metrics=metrics)
     cgx_session = cloudgenix.API(controller=args["controller"], ssl_verify=False)
     cgx_session.set_debug(sdk_debuglevel)
     print("{0} v{1} ({2})\n".format(SCRIPT_NAME, cgx_session.version, cgx_session.controller))
@@ -191,56 +263,97 @@ def go():
 
     # check for token
     if CLOUDGENIX_AUTH_TOKEN and not args["email"] and not args["pass"]:
-        cgx_session.interactive.use_token(CLOUDGENIX_AUTH_TOKEN)
+        scheduler.call(cgx_session.interactive.use_token, CLOUDGENIX_AUTH_TOKEN,
+                       retry_if=lambda result: cgx_session.tenant_id is None, max_retries=2, endpoint="login")
         if cgx_session.tenant_id is None:
             print("AUTH_TOKEN login failure, please check token.")
             sys.exit()
 
     else:
         while cgx_session.tenant_id is None:
-            cgx_session.interactive.login(user_email, user_password)
+            # Not retried on failure, as the next attempt prompts for the credentials again
+            scheduler.call(cgx_session.interactive.login, user_email, user_password, endpoint="login")
             # clear after one failed login, force relogin.
             if not cgx_session.tenant_id:
                 user_email = None
                 user_password = None
+    profiler.add_span("login", login_started, time.perf_counter())
     ############################################################################
-    # Get current license usage
+    # Setup token minter and read current license usage once for all models
     ############################################################################
-    get_license_usage(cgx_session)
+    minter = TokenMinter.for_session(cgx_session, scheduler=scheduler, metrics=metrics, inflight=args["inflight"],
+                                     profiler=profiler)
+    tenant = cgx_session.tenant_id
+    inventory = minter.inventory(tenant)
+    if inventory is None:
+        print("ERR: Could not retrieve VFF Licenses")
+        cleanexit(cgx_session)
+    for error in inventory.errors:
+        print("ERR: {}".format(error))
+    for resp in inventory.failures:
+        cloudgenix.jd_detailed(resp)
+    if inventory.failed:
+        cleanexit(cgx_session)
+
     ############################################################################
-    # Generate VFF License
+    # Generate VFF Licenses. Each token is saved as soon as it is created.
     ############################################################################
-    ION_KEY = None
-    ION_SECRET = None
-    available_count = ionmodel_availablecount_dict[ION_MODEL]
-    if available_count > 0:
-        license_id = ionmodel_licenseid_dict[ION_MODEL]
-        data = {
-            "is_multiuse": multiuse,
-            "vfflicense_id": None,
-            "ion_key": None,
-            "valid_till_secs": 0,
-            "is_revoked": False,
-            "secret_key": None,
-            "is_used": False,
-            "is_expired": False
-        }
-
-        resp = cgx_session.post.tokens_vfflicenses(vfflicense_id=license_id, data=data)
-        if resp.cgx_status:
-            tokendata = resp.cgx_content
-            ION_KEY = tokendata["ion_key"]
-            ION_SECRET = tokendata["secret_key"]
-            print("SUCCESS: {} use VFF token successfully created for {}".format(type, ION_MODEL))
-            print("\n\nKey: {}\nSecret:{}\n\n".format(ION_KEY, ION_SECRET))
-
-        else:
-            print("ERR: Could not create VFF token")
-            cloudgenix.jd_detailed(resp)
-
-    else:
-        print("WARN: No more licenses available for the model: {}".format(ION_MODEL))
-        cleanexit(cgx_session)
+    sinks = []
+    if vfffilename:
+        sinks.append(TokenSink(vfffilename, format=output_format))
+        print("INFO: Saving VFF Keys & Secret to file: {}".format(vfffilename))
+    if dbfilename:
+        store = TokenStore(dbfilename)
+        sinks.append(store)
+        print("INFO: Saving VFF Keys & Secret to token store: {}. Run ID: {}".format(dbfilename, store.run_id))
+    sink = MultiSink(sinks) if len(sinks) > 1 else (sinks[0] if sinks else None)
+
+    def save(token):
+        print("SUCCESS: {} use VFF token successfully created for {}".format(type, token.model))
+        print("\n\nKey: {}\nSecret:{}\n\n".format(token.key, token.secret))
+        if sink is not None:
+            sink.write({"tenant_id": tenant,
+                        "model": token.model,
+                        "use": type,
+                        "key": token.key,
+                        "secret": token.secret})
+
+    mint_started = time.perf_counter()
+    try:
+        for ION_MODEL, count in orders.items():
+            if inventory.status_failed(ION_MODEL):
+                # Reported with the inventory errors above
+                continue
+            available_count = minter.available(tenant, ION_MODEL)
+            if available_count < count:
+                if available_count:
+                    print("WARN: Not enough licenses available to generate {} tokens for {}. Available: {}".format(
+                        count, ION_MODEL, available_count))
+                else:
+                    print("WARN: No more licenses available for the model: {}".format(ION_MODEL))
+                continue
+
+            result = minter.mint(tenant, ION_MODEL, count=count, multiuse=multiuse, on_token=save)
+            for error in result.errors:
+                print("ERR: {}".format(error))
+            for resp in result.failures:
+                cloudgenix.jd_detailed(resp)
+            if result.status == "partial":
+                print("WARN: Only {} of {} tokens created for {}".format(len(result.tokens), count, ION_MODEL))
+    finally:
+        output_started = time.perf_counter()
+        profiler.add_span("mint_loop", mint_started, output_started)
+        if sink is not None:
+            sink.close()
+            print("INFO: Saved {} VFF Keys & Secrets to: {}".format(sink.count, ", ".join(
+                [filename for filename in [vfffilename, dbfilename] if filename])))
+
+    if args["metrics_out"]:
+        print("INFO: Saved metrics to: {}".format(", ".join(metrics.write(args["metrics_out"]))))
+    profiler.add_span("output", output_started, time.perf_counter())
+    if args["profile"]:
+        print_phases(profiler)
+        print("INFO: Saved profile to: {}".format(", ".join(profiler.write(args["profile"]))))
 
     ############################################################################
     # Logout to clear session.
@@ -6,20 +6,26 @@ tkamath@paloaltonetworks.com
 import sys
 import os
 import argparse
-import prisma_sase
-import pandas as pd
+import collections
+import csv
 import datetime
+import importlib.util
+import time
 
 SCRIPT_NAME = "Generate VFF Tokens"
 SCRIPT_VERSION = "v1.0"
 
-# Import Prisma SASE Python SDK
-try:
-    import prisma_sase
-except ImportError as e:
-    prisma_sase = None
-    sys.stderr.write("ERROR: 'prisma_sase' python module required.\n {0}\n".format(e))
-    sys.exit(1)
+# Prisma SASE Python SDK, imported by import_sdk() once arguments are validated
+prisma_sase = None
+
+from vfftoken import AuthTokenCache, login_secret, TokenSink, TenantReader, run_bounded
+from vfftoken import Journal, load_journal, plan_indexes, CallScheduler, Metrics, TokenMinter, TokenPool, make_server
+from vfftoken import read_spec, shared_adapter, share_connections, INFLIGHT
+from vfftoken import INVENTORY_FIELDS, INVENTORY_TYPES, list_children
+from vfftoken import MultiSink, STORE_KEY_ENV, STORE_FIELDS, TokenStore, new_run_id, store_cipher, ion_model
+from vfftoken import AUDIT_FIELDS, STATES, STATUS_WORKERS, created_on, iter_tokens, revoke_token, token_filter
+from vfftoken import JOURNAL_FIELDS, parse_shard, in_shard, merge_fields, merge_rows, merge_journals, read_rows
+from vfftoken import Profiler, NO_PROFILE
 
 # Check for cloudgenix_settings.py config file in cwd.
 sys.path.append(os.getcwd())
@@ -41,42 +47,6 @@ else:
     binary_type = bytes
 
 
-ionmodel_licensecount_dict = {}
-ionmodel_licenseid_dict = {}
-ionmodel_deployedcount_dict = {}
-ionmodel_availablecount_dict = {}
-
-def get_license_usage(sdk):
-    #
-    # Retrive VFF License count for each ION models
-    #
-    resp = sdk.get.vfflicenses()
-    if resp.cgx_status:
-        licenselist = resp.cgx_content.get("items", None)
-
-        for license in licenselist:
-            ionmodel_licensecount_dict[license["model"]] = license["allowed_ions"]
-            ionmodel_licenseid_dict[license["model"]] = license["id"]
-
-            #
-            # Get usage information
-            #
-            resp = sdk.get.vfflicense_status(license["id"])
-            if resp.cgx_status:
-                deployed_count = resp.cgx_content.get("deployed_ions")
-                ionmodel_deployedcount_dict[license["model"]] = deployed_count
-                available_count = license["allowed_ions"] - deployed_count
-                ionmodel_availablecount_dict[license["model"]] = available_count
-
-            else:
-                print("ERR: Could not retrieve VFF License Status for model {}".format(license["model"]))
-                prisma_sase.jd_detailed(resp)
-
-    else:
-        print("ERR: Could not retrieve VFF Licenses")
-        prisma_sase.jd_detailed(resp)
-
-
 model_map = {
     "3102": "ion 3102v",
     "3104": "ion 3104v",
@@ -87,25 +57,119 @@ model_map = {
 }
 
 
-def go():
+def import_sdk():
     """
-    Stub script entry point. Authenticates Prisma SASE SDK, and gathers options from command line to run do_site()
+    Import Prisma SASE Python SDK. Deferred so --help and argument errors do not pay the SDK import cost.
     :return: No return
     """
+    global prisma_sase
+    try:
+        import prisma_sase
+    except ImportError as e:
+        prisma_sase = None
+        sys.stderr.write("ERROR: 'prisma_sase' python module required.\n {0}\n".format(e))
+        sys.exit(1)
 
-    #############################################################################
-    # Begin Script, parse arguments.
-    ############################################################################
 
-    # Parse arguments
-    parser = argparse.ArgumentParser(description="{0}.".format(SCRIPT_NAME))
+def mint_tenant(minter, tenant, orders, sink, journal, completed=None):
+    """
+    Create VFF tokens for a child tenant. Runs in a worker thread.
+    orders is a list of (ION model, number of tokens, use). The tenant is logged in to and its licenses are read
+    once. Every model is checked against that snapshot for all of its orders before any token is created.
+    Each token is written to sink and recorded in the journal as soon as it is created.
+    Token indexes recorded in completed, a dict of (tenant, model) to indexes, are skipped.
+    :return: Number of tokens created
+    """
+    print(tenant)
+
+    plan, needed = plan_indexes(tenant, orders, completed)
+
+    if not sum(needed.values()):
+        print("\tINFO: All tokens already created on tenant: {}. Skipping tenant".format(tenant))
+        return 0
+
+    tokencount = 0
+    try:
+        licenses = minter.inventory(tenant)
+        if licenses is None:
+            print("\tERR: Service Account login failure for tenant: {}. Skipping tenant".format(tenant))
+            return 0
+        for resp in licenses.failures:
+            prisma_sase.jd_detailed(resp)
+        if licenses.failed:
+            raise IOError("; ".join(licenses.errors))
+
+        models = []
+        for ION_MODEL, count in needed.items():
+            if not count:
+                continue
+            available_count = minter.available(tenant, ION_MODEL)
+            if licenses.status_failed(ION_MODEL):
+                print("\tERR: Could not retrieve VFF License Status for {}. Skipping model on tenant: {}".format(
+                    ION_MODEL, tenant))
+            elif available_count >= count:
+                print("\tINFO: Licenses available to generate {} tokens for {} on tenant: {}".format(count, ION_MODEL, tenant))
+                models.append(ION_MODEL)
+            else:
+                print("\tERR: Not enough licenses available to generate {} tokens for {}. Available: {}. Skipping model on tenant: {}".format(
+                    count, ION_MODEL, available_count, tenant))
+
+        for ION_MODEL, use, indexes in plan:
+            if ION_MODEL not in models or not indexes:
+                continue
+
+            def save(token):
+                print("\tSUCCESS: {} use VFF token successfully created for {} on tenant: {}".format(use, token.model, tenant))
+                print("\tKey: {}\n\tSecret:{}".format(token.key, token.secret))
+                sink.write({"tenant_id": tenant,
+                            "model": token.model,
+                            "use": use,
+                            "key": token.key,
+                            "secret": token.secret})
+                journal.record(tenant, token.model, token.index, token.key)
+
+            result = minter.mint(tenant, ION_MODEL, multiuse=use == "multi", indexes=indexes, on_token=save)
+            tokencount += len(result.tokens)
+            for error in result.errors:
+                print("\tERR: {}. Tenant: {}".format(error, tenant))
+            for resp in result.failures:
+                prisma_sase.jd_detailed(resp)
 
+            if len(result.tokens) < len(indexes):
+                print("\tWARN: Only {} of {} {} use tokens created for {} on tenant: {}. Rerun with --resume to create the rest".format(
+                    len(result.tokens), len(indexes), use, ION_MODEL, tenant))
+    finally:
+        minter.release(tenant)
+
+    return tokencount
+
+
+def print_phases(profiler):
+    """
+    Print the wall-clock time spent in each profiled phase
+    :return: No return
+    """
+    for name, (count, seconds) in sorted(profiler.phases().items(), key=lambda item: -item[1][1]):
+        print("INFO: Phase {}: {:.3f}s{}".format(name, seconds, " over {} spans".format(count) if count > 1 else ""))
+
+
+def add_common_arguments(parser):
+    """
+    Add the API, Login and Debug options shared by all commands
+    :return: The Debug argument group, for command specific debug options
+    """
     # Allow Controller modification and debug level sets.
     controller_group = parser.add_argument_group('API', 'These options change how this program connects to the API.')
     controller_group.add_argument("--controller", "-C",
                                   help="Controller URI, ex. "
                                        "C-Prod: https://api.sase.paloaltonetworks.cloudgenix.com",
                                   default=None)
+    controller_group.add_argument("--rate", help="Maximum controller calls per second across all workers. 0 for no limit",
+                                  type=float, default=0)
+    controller_group.add_argument("--max_retries", help="Number of retries for throttled or failed controller calls",
+                                  type=int, default=5)
+    controller_group.add_argument("--inflight", help="Token requests in flight at a time per child tenant",
+                                  type=int, default=INFLIGHT)
 
     login_group = parser.add_argument_group('Login', 'These options allow skipping of interactive login')
     login_group.add_argument("--client_id", "-CI", help="Service Account Client ID",
@@ -114,10 +178,748 @@ def go():
                              default=None)
     login_group.add_argument("--client_tsg", "-CT", help="Service Account TSG",
                              default=None)
+    login_group.add_argument("--auth_cache", "-AC", help="File to cache Service Account access tokens across runs",
+                             default=None)
     # Debug Settings
     debug_group = parser.add_argument_group('Debug', 'These options enable debugging output')
     debug_group.add_argument("--sdkdebug", "-D", help="Enable SDK Debug output, levels 0-2", type=int,
                              default=0)
+    debug_group.add_argument("--metrics_out", help="Write call timings and counters to <prefix>.json and a "
+                                                   "Prometheus textfile <prefix>.prom",
+                             default=None)
+    return debug_group
+
+
+def get_service_account(args):
+    """
+    Service Account details from cloudgenix_settings.py, or from the CLI arguments
+    :return: client_id, client_secret, client_tsg
+    """
+    client_id = client_secret = client_tsg = None
+    if((PRISMASASE_CLIENT_ID is None) and (PRISMASASE_CLIENT_SECRET is None) and (PRISMASASE_CLIENT_TSG is None)):
+        if ((args["client_id"] is None) or (args["client_secret"] is None) or (args["client_tsg"] is None)):
+            print("ERR: Please provide Service Account Details via cloudgenix_settings.py file or CLI arguments to proceed")
+            sys.exit()
+
+        else:
+            client_id = args["client_id"]
+            client_secret = args["client_secret"]
+            client_tsg = args["client_tsg"]
+    else:
+        client_id = PRISMASASE_CLIENT_ID
+        client_secret = PRISMASASE_CLIENT_SECRET
+        client_tsg = PRISMASASE_CLIENT_TSG
+
+    return client_id, client_secret, client_tsg
+
+
+def get_shard(args):
+    """
+    Parse the --shard option. Exits if invalid.
+    :return: (i, N), or None to process every tenant
+    """
+    if not args["shard"]:
+        return None
+    try:
+        return parse_shard(args["shard"])
+    except ValueError as e:
+        print("ERR: {}".format(e))
+        sys.exit()
+
+
+def default_filename(prefix, extension, shard=None):
+    """
+    :return: <prefix>_<timestamp>.<extension>, with _shard<i>of<N> before the extension when sharded
+    """
+    curtime_str = datetime.datetime.utcnow().strftime('%Y-%m-%d-%H-%M-%S')
+    if shard:
+        return "{}_{}_shard{}of{}.{}".format(prefix, curtime_str, shard[0], shard[1], extension)
+    return "{}_{}.{}".format(prefix, curtime_str, extension)
+
+
+def login(args, client_id, client_secret, client_tsg, scheduler, authcache):
+    """
+    Instantiate the Prisma SASE SDK and login to the Service Account TSG. Exits on login failure.
+    Also creates the keep-alive connection pool shared by all tenant sessions, sized to the number of
+    calls the scheduler lets in flight.
+    :return: Authenticated API session, shared HTTPAdapter
+    """
+    sase_session = prisma_sase.API(controller=args["controller"], ssl_verify=False)
+    sase_session.set_debug(args["sdkdebug"])
+    adapter = shared_adapter(scheduler.max_concurrency, sdk=sase_session)
+    share_connections(sase_session, adapter)
+    print("{0} v{1} ({2})\n".format(SCRIPT_NAME, sase_session.version, sase_session.controller))
+
+    #
+    # Use Service Account Details to login to tenant
+    #
+    if not login_secret(sase_session, client_id, client_secret, client_tsg, cache=authcache, scheduler=scheduler):
+        print("ERR: Service Account login failure. Please check client credentials")
+        sys.exit()
+
+    return sase_session, adapter
+
+
+def serve(argv):
+    """
+    Service mode. Keeps a pool of pre-minted tokens per (tenant, model) and hands them out over local HTTP.
+    :return: No return
+    """
+    parser = argparse.ArgumentParser(prog="{} serve".format(os.path.basename(sys.argv[0])),
+                                     description="Serve pre-minted VFF Tokens.")
+    add_common_arguments(parser)
+
+    pool_group = parser.add_argument_group('Pool', 'These options configure the token pool')
+    pool_group.add_argument("--model_name", "-M", help="Comma separated ION models to keep tokens for. "
+                                                       "Allowed values: 3102, 3104, 3108, 7108, 7116",
+                            default="3102")
+    pool_group.add_argument("--use", "-U", help="Single or Multi use token. Allowed values: single or multi",
+                            default="single")
+    pool_group.add_argument("--tsg_id", "-T", help="Child TSG ID", default=None)
+    pool_group.add_argument("--filename", "-F", help="File name with TSG IDs", default=None)
+    pool_group.add_argument("--shard", help="Serve only shard i of N of the TSG IDs, ex. 1/4", default=None)
+    pool_group.add_argument("--low", help="Refill a pool when it has fewer tokens than this", type=int, default=5)
+    pool_group.add_argument("--high", help="Number of tokens to refill a pool to", type=int, default=20)
+    pool_group.add_argument("--store", help="SQLite token store holding the VFF Keys & Secret of pooled tokens until "
+                                            "they are issued, with secrets encrypted by the key in {}. Tokens it "
+                                            "holds are served again after a restart. "
+                                            "Default: vffpool.db".format(STORE_KEY_ENV), default=None)
+    pool_group.add_argument("--host", help="Address to listen on", default="127.0.0.1")
+    pool_group.add_argument("--port", help="Port to listen on", type=int, default=8640)
+    pool_group.add_argument("--auth_token", help="Token clients must send in the X-Auth-Token header. "
+                                                 "Default: VFF_POOL_AUTH_TOKEN environment variable",
+                            default=os.environ.get("VFF_POOL_AUTH_TOKEN", None))
+    args = vars(parser.parse_args(argv))
+
+    models = [model.strip() for model in args["model_name"].split(",") if model.strip()]
+    for model in models:
+        if model not in ["3102", "3104", "3108", "7108", "7116"]:
+            print("ERR: Invalid model_name. Please choose from: 3102, 3104, 3108, 7108, 7116")
+            sys.exit()
+
+    if args["use"] not in ["single", "multi"]:
+        print("ERR: Invalid use. Please choose: single or multi")
+        sys.exit()
+
+    if args["low"] < 1 or args["high"] < args["low"]:
+        print("ERR: Invalid watermarks. Please provide 1 <= low <= high")
+        sys.exit()
+
+    if args["inflight"] < 1:
+        print("ERR: Invalid inflight. Please provide a value of 1 or more")
+        sys.exit()
+
+    if args["filename"] is None and args["tsg_id"] is None:
+        print("ERR: Please provide child TSG ID via a CSV file or the CLI parameter tsg_id")
+        sys.exit()
+
+    shard = get_shard(args)
+
+    if args["filename"]:
+        try:
+            tenantlist = list(TenantReader(args["filename"]))
+        except (IOError, OSError, ValueError) as e:
+            print("ERR: {}".format(e))
+            sys.exit()
+    else:
+        tenantlist = [args["tsg_id"]]
+    if shard:
+        tenantlist = list(in_shard(tenantlist, *shard))
+
+    if args["host"] not in ["127.0.0.1", "localhost", "::1"] and not args["auth_token"]:
+        print("ERR: Please set --auth_token when listening on a non-loopback address")
+        sys.exit()
+
+    storefilename = args["store"]
+    if storefilename is None:
+        storefilename = "vffpool_shard{}of{}.db".format(*shard) if shard else "vffpool.db"
+
+    #
+    # Tokens minted but not issued before a restart are still in the store, and are served first
+    #
+    try:
+        store = TokenStore(storefilename)
+        storerows = list(store.query(secrets=True))
+    except (IOError, OSError, ValueError) as e:
+        print("ERR: {}".format(e))
+        sys.exit()
+
+    client_id, client_secret, client_tsg = get_service_account(args)
+    import_sdk()
+
+    metrics = Metrics()
+    scheduler = CallScheduler(rate=args["rate"], max_retries=args["max_retries"], metrics=metrics)
+    authcache = AuthTokenCache(filename=args["auth_cache"])
+    sase_session, adapter = login(args, client_id, client_secret, client_tsg, scheduler, authcache)
+
+    ############################################################################
+    # Start the pool refill thread and serve tokens
+    ############################################################################
+    minter = TokenMinter.for_service_account(prisma_sase, args["controller"], client_id, client_secret,
+                                             authcache=authcache, adapter=adapter, scheduler=scheduler,
+                                             metrics=metrics, inflight=args["inflight"])
+    pool = TokenPool(minter, multiuse=args["use"] == "multi", low_watermark=args["low"],
+                     high_watermark=args["high"], store=store)
+    for tenant in tenantlist:
+        for model in models:
+            pool.add_target(tenant, model)
+    if storerows:
+        # Oldest first, as query() returns the newest token first
+        print("INFO: Restored {} pooled VFF Tokens from: {}".format(pool.restore(reversed(storerows)), storefilename))
+    pool.start()
+
+    server = make_server(pool, host=args["host"], port=args["port"], auth_token=args["auth_token"])
+    print("INFO: Saving pooled VFF Keys & Secret to token store: {}".format(storefilename))
+    print("INFO: Serving tokens for {} tenants on http://{}:{}/token".format(len(tenantlist), args["host"], args["port"]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("INFO: Stopping")
+    finally:
+        server.server_close()
+        pool.stop()
+        store.close()
+        if args["metrics_out"]:
+            print("INFO: Saved metrics to: {}".format(", ".join(metrics.write(args["metrics_out"]))))
+
+    sys.exit()
+
+
+def add_tenant_arguments(group):
+    """
+    Add the options selecting child tenants for the read-only commands: tsg_id, filename or children
+    :return: No return
+    """
+    group.add_argument("--tsg_id", "-T", help="Child TSG ID", default=None)
+    group.add_argument("--filename", "-F", help="File name with TSG IDs", default=None)
+    group.add_argument("--children", help="Use every child TSG below the Service Account TSG",
+                       action="store_true", default=False)
+    group.add_argument("--shard", help="Process only shard i of N of the TSG IDs, ex. 1/4", default=None)
+
+
+def open_tenants(args):
+    """
+    Validate the tenant options before login. Exits on error.
+    :return: TenantReader if a file was given, else None
+    """
+    if [args["filename"] is not None, args["tsg_id"] is not None, args["children"]].count(True) != 1:
+        print("ERR: Please provide child TSG IDs via one of: a CSV file, the CLI parameter tsg_id or --children")
+        sys.exit()
+
+    get_shard(args)
+    tenantreader = None
+    if args["filename"]:
+        try:
+            tenantreader = TenantReader(args["filename"])
+        except (IOError, OSError, ValueError) as e:
+            print("ERR: {}".format(e))
+            sys.exit()
+    return tenantreader
+
+
+def get_tenants(args, tenantreader, sase_session, client_tsg, scheduler):
+    """
+    Child tenants selected by the tenant options. With children, they are listed from the Tenancy API.
+    With shard, only the TSG IDs of that shard are kept.
+    :return: Iterable of TSG IDs
+    """
+    if args["children"]:
+        tenantlist = list_children(sase_session, client_tsg, scheduler=scheduler)
+        if tenantlist is None:
+            print("ERR: Could not retrieve child TSGs of: {}".format(client_tsg))
+            sys.exit()
+        print("INFO: Found {} child TSGs".format(len(tenantlist)))
+    elif tenantreader is not None:
+        tenantlist = tenantreader
+    else:
+        tenantlist = [args["tsg_id"]]
+
+    shard = get_shard(args)
+    if shard:
+        tenantlist = in_shard(tenantlist, *shard)
+    return tenantlist
+
+
+def inventory(argv):
+    """
+    Read-only report of VFF license usage per child tenant and model. No tokens are created.
+    :return: No return
+    """
+    parser = argparse.ArgumentParser(prog="{} inventory".format(os.path.basename(sys.argv[0])),
+                                     description="Report VFF License usage of child tenants. No tokens are created.")
+    add_common_arguments(parser)
+
+    report_group = parser.add_argument_group('Report', 'These options select the child tenants and the report file')
+    add_tenant_arguments(report_group)
+    report_group.add_argument("--workers", "-W", help="Number of child tenants to scan in parallel",
+                              type=int, default=16)
+    report_group.add_argument("--output", "-O", help="File to save the report to. "
+                                                     "Default: vffinventory_<timestamp>.csv", default=None)
+    report_group.add_argument("--format", help="Report file format. Allowed values: csv, jsonl or parquet. "
+                                               "Default: based on the output file extension", default=None)
+    args = vars(parser.parse_args(argv))
+    workers = args["workers"]
+    reportfilename = args["output"]
+    report_format = args["format"]
+
+    tenantreader = open_tenants(args)
+
+    if workers < 1:
+        print("ERR: Invalid workers. Please provide a value of 1 or more")
+        sys.exit()
+
+    if report_format not in [None, "csv", "jsonl", "parquet"]:
+        print("ERR: Invalid format. Please choose: csv, jsonl or parquet")
+        sys.exit()
+
+    if reportfilename is None:
+        reportfilename = default_filename("vffinventory", report_format or "csv", get_shard(args))
+
+    if (report_format or os.path.splitext(reportfilename)[1].lower().lstrip(".")) == "parquet" and \
+            importlib.util.find_spec("pyarrow") is None:
+        print("ERR: Parquet output requires the 'pyarrow' python module (try 'pip install pyarrow')")
+        sys.exit()
+
+    client_id, client_secret, client_tsg = get_service_account(args)
+    import_sdk()
+
+    metrics = Metrics()
+    scheduler = CallScheduler(rate=args["rate"], max_concurrency=max(16, workers * 4),
+                              max_retries=args["max_retries"], metrics=metrics)
+    authcache = AuthTokenCache(filename=args["auth_cache"])
+    sase_session, adapter = login(args, client_id, client_secret, client_tsg, scheduler, authcache)
+
+    tenantlist = get_tenants(args, tenantreader, sase_session, client_tsg, scheduler)
+
+    ############################################################################
+    # Scan tenants in parallel and stream one row per license to the report
+    ############################################################################
+    report = TokenSink(reportfilename, fields=INVENTORY_FIELDS, format=report_format, types=INVENTORY_TYPES)
+    print("INFO: Saving VFF License inventory to file: {}".format(reportfilename))
+    minter = TokenMinter.for_service_account(prisma_sase, args["controller"], client_id, client_secret,
+                                             authcache=authcache, adapter=adapter, scheduler=scheduler,
+                                             metrics=metrics)
+    available = collections.OrderedDict()
+    counts = collections.Counter()
+
+    def scan(tenant):
+        start = time.monotonic()
+        status = "failed"
+        try:
+            licenses = minter.inventory(tenant)
+            if licenses is None:
+                report.write({"tenant_id": tenant, "status": "login_failed"})
+                return None
+            if licenses.failed:
+                report.write({"tenant_id": tenant, "status": "list_failed"})
+                return licenses
+            if not len(licenses):
+                report.write({"tenant_id": tenant, "status": "no_licenses"})
+            for usage in licenses:
+                report.write({"tenant_id": tenant,
+                              "model": usage.model,
+                              "license_id": usage.license_id,
+                              "allowed_count": usage.allowed_count,
+                              "deployed_count": usage.deployed_count,
+                              "available_count": usage.available_count,
+                              "status": "ok" if usage.available_count is not None else "status_failed"})
+            status = "ok"
+            return licenses
+        finally:
+            minter.release(tenant)
+            metrics.observe_tenant(tenant, time.monotonic() - start, status)
+
+    for tenant, future in run_bounded(scan, tenantlist, workers):
+        try:
+            licenses = future.result()
+        except Exception as e:
+            print("ERR: License scan failed for tenant: {}. {}".format(tenant, e))
+            counts["failed"] += 1
+            continue
+        if licenses is None:
+            print("ERR: Service Account login failure for tenant: {}".format(tenant))
+            counts["failed"] += 1
+            continue
+        if licenses.failed:
+            print("ERR: Could not retrieve VFF Licenses for tenant: {}".format(tenant))
+            counts["failed"] += 1
+            continue
+        counts["ok"] += 1
+        for usage in licenses:
+            available[usage.model] = available.get(usage.model, 0) + (usage.available_count or 0)
+
+    report.close()
+    print("INFO: Scanned {} tenants ({} failed). Saved {} rows to file: {}".format(
+        counts["ok"] + counts["failed"], counts["failed"], report.count, reportfilename))
+    for model, count in available.items():
+        print("\t{}: {} licenses available".format(model, count))
+    if args["metrics_out"]:
+        print("INFO: Saved metrics to: {}".format(", ".join(metrics.write(args["metrics_out"]))))
+
+    sys.exit()
+
+
+def query(argv):
+    """
+    Find tokens in a SQLite token store. Runs offline, without logging in.
+    :return: No return
+    """
+    parser = argparse.ArgumentParser(prog="{} query".format(os.path.basename(sys.argv[0])),
+                                     description="Find VFF Tokens in a SQLite token store.")
+    query_group = parser.add_argument_group('Query', 'These options filter the tokens. Filters are combined')
+    query_group.add_argument("--db", help="SQLite token store written with --db", required=True)
+    query_group.add_argument("--tsg_id", "-T", help="Child TSG ID", default=None)
+    query_group.add_argument("--model_name", "-M", help="ION model, ex. 3102", default=None)
+    query_group.add_argument("--key", help="VFF Key", default=None)
+    query_group.add_argument("--run", help="Run ID printed when the run started, ex. 2024-01-31-10-00-00-1a2b3c4d",
+                             default=None)
+    query_group.add_argument("--since", help="Only tokens created at or after this UTC time, "
+                                             "ex. 2024-01-31 or 2024-01-31T10:00:00Z", default=None)
+    query_group.add_argument("--limit", help="Maximum number of tokens, newest first", type=int, default=None)
+    query_group.add_argument("--show_secrets", help="Decrypt and include the secrets. Needs {}".format(STORE_KEY_ENV),
+                             action="store_true", default=False)
+    query_group.add_argument("--output", "-O", help="File to save the tokens to. Default: print as CSV",
+                             default=None)
+    query_group.add_argument("--format", help="Output file format. Allowed values: csv or jsonl. "
+                                              "Default: based on the output file extension", default=None)
+    args = vars(parser.parse_args(argv))
+
+    if not os.path.isfile(args["db"]):
+        print("ERR: Token store {} does not exist. Please enter the accurate file".format(args["db"]))
+        sys.exit()
+
+    if args["format"] not in [None, "csv", "jsonl"]:
+        print("ERR: Invalid format. Please choose: csv or jsonl")
+        sys.exit()
+
+    fields = STORE_FIELDS if args["show_secrets"] else [field for field in STORE_FIELDS if field != "secret"]
+    if args["output"]:
+        sink = TokenSink(args["output"], fields=fields, format=args["format"])
+    else:
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        sink = None
+
+    store = TokenStore(args["db"], require_key=False)
+    model = ion_model(args["model_name"]) if args["model_name"] else None
+    try:
+        for token in store.query(tenant_id=args["tsg_id"], model=model, key=args["key"], run_id=args["run"],
+                                 since=args["since"], limit=args["limit"], secrets=args["show_secrets"]):
+            if sink is not None:
+                sink.write(token)
+            else:
+                writer.writerow(token)
+    except ValueError as e:
+        print("ERR: {}".format(e))
+        if sink is not None:
+            sink.close(commit=False)
+        sys.exit()
+    finally:
+        store.close()
+
+    if sink is not None:
+        sink.close()
+        print("INFO: Saved {} VFF Keys to file: {}".format(sink.count, args["output"]))
+
+    sys.exit()
+
+
+def audit(argv):
+    """
+    List existing tokens matching filters and, with --revoke, revoke them
+    :return: No return
+    """
+    parser = argparse.ArgumentParser(prog="{} audit".format(os.path.basename(sys.argv[0])),
+                                     description="List and revoke existing VFF Tokens. Only lists unless --revoke "
+                                                 "is given.")
+    add_common_arguments(parser)
+
+    audit_group = parser.add_argument_group('Audit', 'These options select the tokens to list or revoke')
+    add_tenant_arguments(audit_group)
+    audit_group.add_argument("--model_name", "-M", help="Comma separated ION models. Default: all models",
+                             default=None)
+    audit_group.add_argument("--state", help="Comma separated token states, any of which must apply. "
+                                             "Allowed values: {}. Default: all tokens that are not revoked".format(
+                                                 ", ".join(STATES)), default=None)
+    audit_group.add_argument("--older_than", help="Only tokens created at least this many days ago", type=float,
+                             default=None)
+    audit_group.add_argument("--use", "-U", help="Only single or multi use tokens", default=None)
+    audit_group.add_argument("--revoke", help="Revoke the matching tokens. Needs at least one of model_name, state, "
+                                              "older_than or use, or --all", action="store_true", default=False)
+    audit_group.add_argument("--all", help="With --revoke, revoke every token that is not revoked, including "
+                                           "unused ones", action="store_true", default=False)
+    audit_group.add_argument("--workers", "-W", help="Number of child tenants to audit in parallel",
+                             type=int, default=8)
+    audit_group.add_argument("--output", "-O", help="File to save the matching tokens to, without secrets. "
+                                                    "Default: vffaudit_<timestamp>.csv", default=None)
+    audit_group.add_argument("--format", help="Output file format. Allowed values: csv or jsonl. "
+                                              "Default: based on the output file extension", default=None)
+    args = vars(parser.parse_args(argv))
+    workers = args["workers"]
+    reportfilename = args["output"]
+    revoke = args["revoke"]
+
+    tenantreader = open_tenants(args)
+
+    models = None
+    if args["model_name"]:
+        models = [model.strip() for model in args["model_name"].split(",") if model.strip()]
+        if any(model not in ["3102", "3104", "3108", "7108", "7116"] for model in models):
+            print("ERR: Invalid model_name. Please choose from: 3102, 3104, 3108, 7108, 7116")
+            sys.exit()
+        models = [model_map[model] for model in models]
+
+    states = None
+    if args["state"]:
+        states = [state.strip() for state in args["state"].split(",") if state.strip()]
+        if any(state not in STATES for state in states):
+            print("ERR: Invalid state. Please choose from: {}".format(", ".join(STATES)))
+            sys.exit()
+
+    if args["use"] not in [None, "single", "multi"]:
+        print("ERR: Invalid use. Please choose: single or multi")
+        sys.exit()
+
+    if args["older_than"] is not None and args["older_than"] < 0:
+        print("ERR: Invalid older_than. Please provide a value of 0 or more")
+        sys.exit()
+
+    if workers < 1 or args["inflight"] < 1:
+        print("ERR: Invalid workers or inflight. Please provide a value of 1 or more")
+        sys.exit()
+
+    if args["format"] not in [None, "csv", "jsonl"]:
+        print("ERR: Invalid format. Please choose: csv or jsonl")
+        sys.exit()
+
+    #
+    # Without a filter every token matches, including ones just created and not yet used
+    #
+    filtered = models or states or args["older_than"] is not None or args["use"] is not None
+    if revoke and not filtered and not args["all"]:
+        print("ERR: --revoke without model_name, state, older_than or use would revoke every token. "
+              "Please add a filter, or --all to revoke them all")
+        sys.exit()
+    if args["all"] and not revoke:
+        print("ERR: --all is only used with --revoke")
+        sys.exit()
+
+    if reportfilename is None:
+        reportfilename = default_filename("vffaudit", args["format"] or "csv", get_shard(args))
+
+    older_than = args["older_than"] * 86400 if args["older_than"] is not None else None
+    match = token_filter(states=states, older_than=older_than, use=args["use"])
+
+    client_id, client_secret, client_tsg = get_service_account(args)
+    import_sdk()
+
+    metrics = Metrics()
+    scheduler = CallScheduler(rate=args["rate"], max_concurrency=max(16, workers * max(4, args["inflight"])),
+                              max_retries=args["max_retries"], metrics=metrics)
+    authcache = AuthTokenCache(filename=args["auth_cache"])
+    sase_session, adapter = login(args, client_id, client_secret, client_tsg, scheduler, authcache)
+    tenantlist = get_tenants(args, tenantreader, sase_session, client_tsg, scheduler)
+
+    ############################################################################
+    # Page through the tokens of every license and revoke the matching ones
+    ############################################################################
+    report = TokenSink(reportfilename, fields=AUDIT_FIELDS, format=args["format"])
+    print("INFO: {} matching VFF Tokens. Saving them to file: {}".format("Revoking" if revoke else "Listing",
+                                                                         reportfilename))
+    minter = TokenMinter.for_service_account(prisma_sase, args["controller"], client_id, client_secret,
+                                             authcache=authcache, adapter=adapter, scheduler=scheduler,
+                                             metrics=metrics)
+    counts = collections.Counter()
+
+    def audit_license(tenant, sdk, usage):
+        #
+        # Matching tokens are pulled from the pages lazily, so at most inflight revocations are pending
+        #
+        def matching():
+            for token in iter_tokens(sdk, usage.license_id, scheduler=scheduler):
+                if match(token):
+                    yield token
+
+        def process(token):
+            if not revoke or token.get("is_revoked"):
+                return "listed"
+            resp = revoke_token(sdk, token, scheduler=scheduler)
+            if not resp.cgx_status:
+                print("\tERR: Could not revoke token {} on tenant: {}. Status: {}".format(
+                    token.get("ion_key"), tenant, getattr(resp, "status_code", None)))
+                return "revoke_failed"
+            return "revoked"
+
+        licensecounts = collections.Counter()
+        for token, future in run_bounded(process, matching(), args["inflight"]):
+            action = future.result()
+            licensecounts[action] += 1
+            created = created_on(token)
+            report.write({"tenant_id": tenant,
+                          "model": usage.model,
+                          "license_id": usage.license_id,
+                          "token_id": token.get("id"),
+                          "key": token.get("ion_key"),
+                          "use": "multi" if token.get("is_multiuse") else "single",
+                          "is_used": token.get("is_used"),
+                          "is_expired": token.get("is_expired"),
+                          "is_revoked": token.get("is_revoked") or action == "revoked",
+                          "created_on": datetime.datetime.utcfromtimestamp(created).strftime(
+                              '%Y-%m-%dT%H:%M:%SZ') if created is not None else None,
+                          "action": action})
+        return licensecounts
+
+    def audit_tenant(tenant):
+        start = time.monotonic()
+        status = "failed"
+        tenantcounts = collections.Counter()
+        try:
+            licenses = minter.inventory(tenant)
+            sdk = minter.session(tenant)
+            if licenses is None or sdk is None:
+                print("ERR: Service Account login failure for tenant: {}".format(tenant))
+                return tenantcounts
+            if licenses.failed:
+                print("ERR: Could not retrieve VFF Licenses for tenant: {}".format(tenant))
+                tenantcounts["failed"] += 1
+                return tenantcounts
+            licenses = [usage for usage in licenses if models is None or usage.model in models]
+            for usage, future in run_bounded(lambda usage: audit_license(tenant, sdk, usage), licenses,
+                                             STATUS_WORKERS):
+                try:
+                    tenantcounts.update(future.result())
+                except Exception as e:
+                    print("ERR: Token audit failed for {} on tenant: {}. {}".format(usage.model, tenant, e))
+                    tenantcounts["failed"] += 1
+            status = "ok"
+            return tenantcounts
+        finally:
+            minter.release(tenant)
+            metrics.observe_tenant(tenant, time.monotonic() - start, status)
+
+    tenantcount = 0
+    for tenant, future in run_bounded(audit_tenant, tenantlist, workers):
+        tenantcount += 1
+        try:
+            counts.update(future.result())
+        except Exception as e:
+            print("ERR: Token audit failed for tenant: {}. {}".format(tenant, e))
+
+    report.close()
+    print("INFO: Audited {} tenants. Tokens matched: {}, revoked: {}, revoke failed: {}. Saved to file: {}".format(
+        tenantcount, sum(counts[action] for action in ["listed", "revoked", "revoke_failed"]), counts["revoked"],
+        counts["revoke_failed"], reportfilename))
+    if args["metrics_out"]:
+        print("INFO: Saved metrics to: {}".format(", ".join(metrics.write(args["metrics_out"]))))
+
+    sys.exit()
+
+
+def merge(argv):
+    """
+    Combine the output files and journals of sharded runs into one deduplicated output and journal.
+    Runs offline, without logging in.
+    :return: No return
+    """
+    parser = argparse.ArgumentParser(prog="{} merge".format(os.path.basename(sys.argv[0])),
+                                     description="Merge the output files and journals of sharded runs.")
+    merge_group = parser.add_argument_group('Merge', 'These options select the files to merge')
+    merge_group.add_argument("files", help="Output files of the shards, csv or jsonl. .partial files of "
+                                           "crashed runs can be included", nargs="+")
+    merge_group.add_argument("--output", "-O", help="File to save the merged tokens to", required=True)
+    merge_group.add_argument("--format", help="Output file format. Allowed values: csv or jsonl. "
+                                              "Default: based on the output file extension", default=None)
+    merge_group.add_argument("--journals", help="Journals of the shards", nargs="*", default=[])
+    merge_group.add_argument("--journal_out", help="File to save the merged journal to. "
+                                                   "Default: <output>.journal when journals are given",
+                             default=None)
+    args = vars(parser.parse_args(argv))
+    outfilename = args["output"]
+    journalfilename = args["journal_out"]
+    # A file given twice is read once
+    args["files"] = list(collections.OrderedDict.fromkeys(args["files"]))
+    args["journals"] = list(collections.OrderedDict.fromkeys(args["journals"]))
+
+    for filename in args["files"] + args["journals"]:
+        if not os.path.isfile(filename):
+            print("ERR: File {} does not exist. Please enter the accurate file".format(filename))
+            sys.exit()
+        if os.path.abspath(filename) in [os.path.abspath(outfilename),
+                                         os.path.abspath(journalfilename or outfilename)]:
+            print("ERR: Please choose an output file that is not one of the inputs: {}".format(filename))
+            sys.exit()
+
+    if args["format"] not in [None, "csv", "jsonl"]:
+        print("ERR: Invalid format. Please choose: csv or jsonl")
+        sys.exit()
+
+    if args["journals"] and journalfilename is None:
+        journalfilename = "{}.journal".format(outfilename)
+
+    try:
+        fields = merge_fields(args["files"])
+        with TokenSink(outfilename, fields=fields, format=args["format"]) as sink:
+            stats = merge_rows(args["files"], sink)
+        journalstats = None
+        if args["journals"]:
+            with TokenSink(journalfilename, fields=JOURNAL_FIELDS, format="jsonl") as journal:
+                journalstats = merge_journals(args["journals"], journal)
+    except (IOError, OSError, ValueError) as e:
+        print("ERR: {}".format(e))
+        sys.exit()
+
+    ############################################################################
+    # Summary
+    ############################################################################
+    for filename, filestats in stats["files"].items():
+        print("INFO: {}: {} rows, {} duplicates".format(filename, filestats["read"], filestats["duplicates"]))
+    print("INFO: Saved {} tokens for {} tenants to file: {} ({} duplicates dropped)".format(
+        stats["rows"], len(stats["tenants"]), outfilename, stats["duplicates"]))
+    for model, count in sorted(stats["models"].items()):
+        print("\t{}: {}".format(model, count))
+    if journalstats is not None:
+        print("INFO: Saved {} journal entries to file: {} ({} duplicates dropped)".format(
+            journalstats["entries"], journalfilename, journalstats["duplicates"]))
+        missing = len(journalstats["keys"] - stats["keys"])
+        if missing:
+            print("WARN: {} tokens recorded in the journals are not in the output files. Include the .partial "
+                  "files of crashed shards to recover them".format(missing))
+
+    sys.exit()
+
+
+# Subcommands. Without one, the script creates tokens as before.
+COMMANDS = {
+    "serve": serve,
+    "inventory": inventory,
+    "query": query,
+    "audit": audit,
+    "merge": merge
+}
+
+
+def go():
+    """
+    Stub script entry point. Authenticates Prisma SASE SDK, and gathers options from command line to run do_site()
+    :return: No return
+    """
+
+    #############################################################################
+    # Begin Script, parse arguments.
+    ############################################################################
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        return COMMANDS[sys.argv[1]](sys.argv[2:])
+    started = time.perf_counter()
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description="{0}.".format(SCRIPT_NAME),
+                                     epilog="Commands: {}. Run '<command> -h' for help.".format(", ".join(COMMANDS)))
+
+    debug_group = add_common_arguments(parser)
+    debug_group.add_argument("--profile", help="Profile the run. Writes cProfile stats to <prefix>.prof and the time "
+                                               "spent in each phase to <prefix>.trace.json, for a flamegraph or "
+                                               "trace viewer",
+                             default=None)
 
     # Config Settings
     config_group = parser.add_argument_group('Config', 'These options are to provide VFF license parameters')
@@ -130,160 +932,256 @@ def go():
                               default=1)
     config_group.add_argument("--tsg_id", "-T", help="Child TSG ID", default=None)
     config_group.add_argument("--filename", "-F", help="File name with TSG IDs", default=None)
+    config_group.add_argument("--spec", "-S", help="CSV file with the columns tsg_id, model, count and use, to create "
+                                                   "tokens for several models in one run. "
+                                                   "Replaces model_name, use, num, tsg_id and filename",
+                              default=None)
+    config_group.add_argument("--workers", "-W", help="Number of child tenants to process in parallel",
+                              type=int, default=1)
+    config_group.add_argument("--shard", help="Process only shard i of N of the TSG IDs, ex. 1/4. TSG IDs are split "
+                                              "into N disjoint shards by a stable hash, so N processes or hosts can "
+                                              "each take one. Combine their outputs with the merge command",
+                              default=None)
+    config_group.add_argument("--output", "-O", help="File to save VFF Keys & Secret. Default: vffdata_<timestamp>.csv",
+                              default=None)
+    config_group.add_argument("--format", help="Output file format. Allowed values: csv or jsonl. "
+                                               "Default: based on the output file extension",
+                              default=None)
+    config_group.add_argument("--db", help="SQLite token store to save VFF Keys & Secret to, with secrets encrypted "
+                                           "by the key in {}. Replaces the default output file".format(STORE_KEY_ENV),
+                              default=None)
+    config_group.add_argument("--journal", help="File to record each token created. Default: <output>.journal, or "
+                                                "<db>.<run_id>.journal",
+                              default=None)
+    config_group.add_argument("--resume", help="Journal of an earlier run. Tokens recorded in it are skipped and "
+                                               "new tokens are appended to it",
+                              default=None)
 
 
     ############################################################################
     # Parse arguments provided via CLI
     ############################################################################
     args = vars(parser.parse_args())
-    sdk_debuglevel = args["sdkdebug"]
     model_name = args["model_name"]
     use = args["use"]
     tsg_id = args["tsg_id"]
     filename = args["filename"]
     num = int(args["num"])
+    workers = args["workers"]
+    rate = args["rate"]
+    max_retries = args["max_retries"]
+    inflight = args["inflight"]
+    vfffilename = args["output"]
+    output_format = args["format"]
+    journalfilename = args["journal"]
+    resumefilename = args["resume"]
+    specfilename = args["spec"]
+    dbfilename = args["db"]
+    shard = get_shard(args)
 
-    if filename is None and tsg_id is None:
-        print("ERR: Please provide child TSG ID via a CSV file or the CLI parameter tsg_id")
+    if filename is None and tsg_id is None and specfilename is None:
+        print("ERR: Please provide child TSG ID via a CSV file, a spec file or the CLI parameter tsg_id")
         sys.exit()
 
-    singletenant = True
+    orders = {}
+    if specfilename:
+        if filename or tsg_id:
+            print("ERR: Please provide either a spec file or child TSG IDs, not both")
+            sys.exit()
+        try:
+            spec = read_spec(specfilename, allowed_models=["3102", "3104", "3108", "7108", "7116"])
+        except (IOError, OSError, ValueError) as e:
+            print("ERR: {}".format(e))
+            sys.exit()
+        for tenant, rows in spec.items():
+            orders[tenant] = [(model_map[row.model], row.count, row.use) for row in rows]
+
+    tenantreader = None
     if filename:
         if not os.path.isfile(filename):
             print("ERR: File {} does not exist. Please enter the accurate file".format(filename))
             sys.exit()
         else:
-            singletenant = False
+            #
+            # Validate the CSV header before logging in
+            #
+            try:
+                tenantreader = TenantReader(filename)
+            except ValueError as e:
+                print("ERR: {}".format(e))
+                sys.exit()
 
-    if use not in ["single", "multi"]:
-        print("ERR: Invalid use. Please choose: single or multi")
+    if num < 1:
+        print("ERR: Invalid num. Please provide a value of 1 or more")
         sys.exit()
 
-    if use == "single":
-        multiuse = "false"
-    else:
-        multiuse = "true"
+    if workers < 1:
+        print("ERR: Invalid workers. Please provide a value of 1 or more")
+        sys.exit()
 
-    if model_name not in ["3102", "3104", "3108", "7108", "7116"]:
-        print("ERR: Invalid model_name. Please choose from: 3102, 3104, 3108, 7108, 7116")
+    if rate < 0 or max_retries < 0:
+        print("ERR: Invalid rate or max_retries. Please provide a value of 0 or more")
         sys.exit()
 
-    client_id = client_secret = client_tsg = None
-    if((PRISMASASE_CLIENT_ID is None) and (PRISMASASE_CLIENT_SECRET is None) and (PRISMASASE_CLIENT_TSG is None)):
-        if ((args["client_id"] is None) or (args["client_secret"] is None) or (args["client_tsg"] is None)):
-            print("ERR: Please provide Service Account Details via cloudgenix_settings.py file or CLI arguments to proceed")
+    if inflight < 1:
+        print("ERR: Invalid inflight. Please provide a value of 1 or more")
+        sys.exit()
+
+    if output_format not in [None, "csv", "jsonl"]:
+        print("ERR: Invalid format. Please choose: csv or jsonl")
+        sys.exit()
+
+    if dbfilename:
+        try:
+            store_cipher()
+        except ValueError as e:
+            print("ERR: {}".format(e))
+            sys.exit()
+
+    if vfffilename is None and dbfilename is None:
+        vfffilename = default_filename("vffdata", output_format or "csv", shard)
+
+    completed = {}
+    if resumefilename:
+        if not os.path.isfile(resumefilename):
+            print("ERR: Journal {} does not exist. Please enter the accurate file".format(resumefilename))
             sys.exit()
+        completed = load_journal(resumefilename)
+        journalfilename = resumefilename
+        print("INFO: Resuming from journal {} with {} tokens already created".format(
+            resumefilename, sum(len(indexes) for indexes in completed.values())))
 
+    #
+    # Every run adds to the same token store, so each run gets its own journal. Resuming from a journal of all
+    # runs would skip the tokens of earlier completed runs.
+    #
+    run_id = new_run_id()
+    if journalfilename is None:
+        if vfffilename:
+            journalfilename = "{}.journal".format(vfffilename)
         else:
-            client_id = args["client_id"]
-            client_secret = args["client_secret"]
-            client_tsg = args["client_tsg"]
-    else:
-        client_id = PRISMASASE_CLIENT_ID
-        client_secret = PRISMASASE_CLIENT_SECRET
-        client_tsg = PRISMASASE_CLIENT_TSG
+            journalfilename = "{}.{}.journal".format(dbfilename, run_id)
 
+    #
+    # Output left by an earlier run holds secrets that exist nowhere else. It is only added to by a resumed run.
+    #
+    if vfffilename and not resumefilename:
+        for existing in [vfffilename, "{}.partial".format(vfffilename)]:
+            if os.path.exists(existing):
+                print("ERR: {} already exists. Please rerun with --resume <journal> to add to it, or choose another "
+                      "output file".format(existing))
+                sys.exit()
+
+    if use not in ["single", "multi"]:
+        print("ERR: Invalid use. Please choose: single or multi")
+        sys.exit()
+
+    if model_name not in ["3102", "3104", "3108", "7108", "7116"]:
+        print("ERR: Invalid model_name. Please choose from: 3102, 3104, 3108, 7108, 7116")
+        sys.exit()
+
+    client_id, client_secret, client_tsg = get_service_account(args)
 
     ION_MODEL = model_map[model_name]
-    ############################################################################
-    # Instantiate API & Login
-    ############################################################################
-    sase_session = prisma_sase.API(controller=args["controller"], ssl_verify=False)
-    sase_session.set_debug(sdk_debuglevel)
-    print("{0} v{1} ({2})\n".format(SCRIPT_NAME, sase_session.version, sase_session.controller))
+    default_orders = [(ION_MODEL, num, use)]
 
     #
-    # Use Service Account Details to login to tenant
+    # Argument parsing is timed but not profiled, as the profiler only starts once the arguments are known
     #
-    sase_session.interactive.login_secret(client_id=client_id, client_secret=client_secret, tsg_id=client_tsg)
-    if sase_session.tenant_id is None:
-        print("ERR: Service Account login failure. Please check client credentials")
-        sys.exit()
+    profiler = NO_PROFILE
+    if args["profile"]:
+        profiler = Profiler(origin=started)
+        profiler.add_span("parse", started, time.perf_counter())
+        profiler.start()
+
+    with profiler.span("import_sdk"):
+        import_sdk()
+    ############################################################################
+    # Instantiate API & Login
+    ############################################################################
+    metrics = Metrics()
+    scheduler = CallScheduler(rate=rate, max_concurrency=max(16, workers * max(4, inflight)), max_retries=max_retries,
+                              metrics=metrics)
+    authcache = AuthTokenCache(filename=args["auth_cache"])
+    with profiler.span("login"):
+        sase_session, adapter = login(args, client_id, client_secret, client_tsg, scheduler, authcache)
 
     ############################################################################
     # Determine List of TSG IDs
     ############################################################################
 
-    tenantlist = []
-    if singletenant:
-        tenantlist.append(tsg_id)
+    #
+    # TSG IDs are streamed from the CSV file and deduplicated as they are read
+    #
+    if specfilename:
+        tenantlist = list(orders)
+    elif tenantreader is None:
+        tenantlist = [tsg_id]
     else:
-        tdata = pd.read_csv(filename)
-        columns = list(tdata.columns)
-
-        if "tsg_id" not in columns:
-            print("ERR: Invalid CSV. Please provide a CSV file with the column header: tsg_is")
-            sys.exit()
-
-        tenantlist = tdata.tsg_id.unique()
+        tenantlist = tenantreader
+    if shard:
+        tenantlist = in_shard(tenantlist, *shard)
+        print("INFO: Processing shard {} of {}".format(*shard))
 
     ############################################################################
     # Iterate through tenant list to get:
     # - License Types
     # - Create VFF
     ############################################################################
-    vffdata = pd.DataFrame()
-    for tenant in tenantlist:
-        tokennum = num
-        print(tenant)
-        sdk = prisma_sase.API(controller=args["controller"], ssl_verify=False)
-        sdk.interactive.login_secret(client_id=client_id, client_secret=client_secret, tsg_id=tenant)
-        get_license_usage(sdk)
-        ############################################################################
-        # Generate VFF License
-        ############################################################################
-        ION_KEY = None
-        ION_SECRET = None
-        available_count = ionmodel_availablecount_dict[ION_MODEL]
-        if available_count - num > 0:
-            print("\tINFO: Licenses available to generate {} tokens for {}".format(num, ION_MODEL))
-        else:
-            print("\tERR: Not enough licenses available to generate {} tokens for {}. Skipping tenant: {}".format(num, ION_MODEL, tenant))
-            continue
+    sinks = []
+    if vfffilename:
+        try:
+            sinks.append(TokenSink(vfffilename, format=output_format, append=bool(resumefilename)))
+        except ValueError as e:
+            print("ERR: {}".format(e))
+            sys.exit()
+        print("INFO: Saving VFF Keys & Secret to file: {}".format(vfffilename))
+    if dbfilename:
+        sinks.append(TokenStore(dbfilename, run_id=run_id))
+        print("INFO: Saving VFF Keys & Secret to token store: {}. Run ID: {}".format(dbfilename, run_id))
+    sink = MultiSink(sinks) if len(sinks) > 1 else sinks[0]
+    journal = Journal(journalfilename)
+    print("INFO: Recording progress to journal: {}".format(journalfilename))
+    minter = TokenMinter.for_service_account(prisma_sase, args["controller"], client_id, client_secret,
+                                             authcache=authcache, adapter=adapter, scheduler=scheduler,
+                                             metrics=metrics, inflight=inflight, profiler=profiler)
 
-        if available_count > 0:
-            license_id = ionmodel_licenseid_dict[ION_MODEL]
-            data = {
-                "is_multiuse": multiuse,
-                "vfflicense_id": None,
-                "ion_key": None,
-                "valid_till_secs": 0,
-                "is_revoked": False,
-                "secret_key": None,
-                "is_used": False,
-                "is_expired": False
-            }
-
-            while tokennum > 0:
-                resp = sdk.post.tokens_vfflicenses(vfflicense_id=license_id, data=data)
-                if resp.cgx_status:
-                    tokendata = resp.cgx_content
-                    ION_KEY = tokendata["ion_key"]
-                    ION_SECRET = tokendata["secret_key"]
-                    print("\tSUCCESS: {} use VFF token successfully created for {}".format(use, ION_MODEL))
-                    print("\tKey: {}\n\tSecret:{}".format(ION_KEY, ION_SECRET))
-                    vffdata = vffdata.append({"tenant_id": tenant,
-                                              "model": ION_MODEL,
-                                              "key": ION_KEY,
-                                              "secret": ION_SECRET}, ignore_index=True)
-
-                else:
-                    print("ERR: Could not create VFF token")
-                    prisma_sase.jd_detailed(resp)
-
-                tokennum = tokennum-1
+    def mint(tenant):
+        start = time.monotonic()
+        status = "failed"
+        try:
+            with profiler.span("tenant", tenant=tenant):
+                tokencount = mint_tenant(minter, tenant, orders.get(tenant, default_orders), sink, journal,
+                                         completed=completed)
+            status = "ok" if tokencount else "skipped"
+            return tokencount
+        finally:
+            metrics.observe_tenant(tenant, time.monotonic() - start, status)
 
-        else:
-            print("WARN: No more licenses available for the model: {}".format(ION_MODEL))
-            sys.exit()
+    #
+    # Tokens are streamed to the output file by the workers.
+    # A failure in one tenant is reported and does not stop the others.
+    #
+    with profiler.span("mint_loop", workers=workers):
+        for tenant, future in run_bounded(mint, tenantlist, workers):
+            try:
+                future.result()
+            except Exception as e:
+                print("ERR: Token generation failed for tenant: {}. {}".format(tenant, e))
 
     ############################################################################
     # Save VFF Key & Secret in CSV File
     ############################################################################
-    curtime_str = datetime.datetime.utcnow().strftime('%Y-%m-%d-%H-%M-%S')
-    vfffilename = "vffdata_{}.csv".format(curtime_str)
-    print("INFO: Saving VFF Keys & Secret to file: {}".format(vfffilename))
-    vffdata.to_csv(vfffilename, index=False)
+    with profiler.span("output"):
+        sink.close()
+        journal.close()
+        print("INFO: Saved {} VFF Keys & Secret to: {}".format(sink.count, ", ".join(
+            [filename for filename in [vfffilename, dbfilename] if filename])))
+        if args["metrics_out"]:
+            print("INFO: Saved metrics to: {}".format(", ".join(metrics.write(args["metrics_out"]))))
+    if args["profile"]:
+        print_phases(profiler)
+        print("INFO: Saved profile to: {}".format(", ".join(profiler.write(args["profile"]))))
     ############################################################################
     # Exit Script
     ############################################################################
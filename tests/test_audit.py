@@ -0,0 +1,56 @@
+import time
+import unittest
+
+from vfftoken import token_filter
+from vfftoken.audit import QUERY_METHODS, TOKEN_METHODS, created_on, sdk_method
+
+SDKS = []
+for name in ["prisma_sase", "cloudgenix"]:
+    try:
+        SDKS.append(__import__(name))
+    except ImportError:
+        pass
+
+DAY = 86400
+
+
+def token(used=False, expired=False, revoked=False, multiuse=True, age_days=0):
+    return {"is_used": used, "is_expired": expired, "is_revoked": revoked, "is_multiuse": multiuse,
+            "_created_on_utc": int((time.time() - age_days * DAY) * 1e7)}
+
+
+class SdkMethodTest(unittest.TestCase):
+
+    @unittest.skipIf(not SDKS, "No SDK is installed")
+    def test_token_methods_exist_in_sdks(self):
+        for sdk in SDKS:
+            api = sdk.API(ssl_verify=False)
+            self.assertEqual(sdk_method(api.post, QUERY_METHODS).__name__, QUERY_METHODS[0], sdk.__name__)
+            self.assertIsNotNone(sdk_method(api.get, TOKEN_METHODS), sdk.__name__)
+            self.assertIsNotNone(sdk_method(api.put, TOKEN_METHODS), sdk.__name__)
+
+
+class TokenFilterTest(unittest.TestCase):
+
+    def test_created_on_units(self):
+        now = time.time()
+        for scale in [1, 1e3, 1e6, 1e7]:
+            self.assertAlmostEqual(created_on({"_created_on_utc": now * scale}), now, delta=1)
+        self.assertIsNone(created_on({}))
+
+    def test_revoked_tokens_only_match_when_listed(self):
+        self.assertTrue(token_filter()(token()))
+        self.assertFalse(token_filter()(token(revoked=True)))
+        self.assertTrue(token_filter(states=["revoked"])(token(revoked=True)))
+
+    def test_conditions_combined(self):
+        match = token_filter(states=["unused"], older_than=30 * DAY, use="multi")
+        self.assertTrue(match(token(age_days=40)))
+        self.assertFalse(match(token(age_days=10)))
+        self.assertFalse(match(token(used=True, age_days=40)))
+        self.assertFalse(match(token(multiuse=False, age_days=40)))
+        self.assertFalse(match({"is_used": False, "is_multiuse": True}))
+
+
+if __name__ == "__main__":
+    unittest.main()
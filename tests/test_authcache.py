@@ -0,0 +1,115 @@
+import base64
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import requests
+from requests.adapters import BaseAdapter
+
+from vfftoken import AuthTokenCache, TokenMinter, get_license_usage, login_secret
+from vfftoken.authcache import EXPIRY_MARGIN
+
+try:
+    import prisma_sase
+except ImportError:
+    prisma_sase = None
+
+
+def make_jwt(expires_at):
+    def encode(claims):
+        return base64.urlsafe_b64encode(json.dumps(claims).encode("utf-8")).decode("ascii").rstrip("=")
+    return "{}.{}.signature".format(encode({"alg": "none"}), encode({"exp": expires_at}))
+
+
+class FakeController(BaseAdapter):
+    """
+    Transport adapter answering the login and license calls of the prisma_sase SDK
+    """
+
+    def __init__(self, expires_in=900):
+        super(FakeController, self).__init__()
+        self.expires_in = expires_in
+        self.paths = []
+
+    def send(self, request, **kwargs):
+        path = request.url.split("?")[0]
+        self.paths.append(path.rsplit("/", 1)[-1])
+        if "access_token" in path:
+            content = {"access_token": make_jwt(time.time() + self.expires_in), "expires_in": self.expires_in}
+        elif path.endswith("/profile"):
+            content = {"tenant_id": "1234", "email": "sa@example.com", "id": "1"}
+        elif "/tenants" in path:
+            content = {"name": "tenant", "telemetry_region": "americas"}
+        else:
+            content = {"items": []}
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(content).encode("utf-8")
+        response.headers["content-type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@unittest.skipIf(prisma_sase is None, "prisma_sase is not installed")
+class LoginSecretTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = FakeController()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = AuthTokenCache(filename=os.path.join(self.tmpdir, "auth.json"))
+        update_session_adapter = prisma_sase.API.update_session_adapter
+        controller = self.controller
+
+        def mount_fake(sdk, *args, **kwargs):
+            result = update_session_adapter(sdk, *args, **kwargs)
+            sdk._session.mount("https://", controller)
+            return result
+
+        prisma_sase.API.update_session_adapter = mount_fake
+        self.addCleanup(setattr, prisma_sase.API, "update_session_adapter", update_session_adapter)
+
+    def api(self):
+        sdk = prisma_sase.API(controller="https://api.sase.paloaltonetworks.com", ssl_verify=False)
+        sdk._session.mount("https://", self.controller)
+        return sdk
+
+    def test_cache_hit_session_can_call_api(self):
+        self.assertTrue(login_secret(self.api(), "client", "secret", "1234", cache=self.cache))
+
+        sdk = self.api()
+        calls = len(self.controller.paths)
+        self.assertTrue(login_secret(sdk, "client", "secret", "1234", cache=self.cache))
+        self.assertEqual(len(self.controller.paths), calls)
+        self.assertEqual(sdk.tenant_id, "1234")
+        self.assertIsNotNone(get_license_usage(sdk))
+
+    def test_cache_hit_session_refreshes_expiring_token(self):
+        login_secret(self.api(), "client", "secret", "1234", cache=self.cache)
+        sdk = self.api()
+        login_secret(sdk, "client", "secret", "1234", cache=self.cache)
+
+        sdk.jwt_expires_at = datetime.datetime.now() + datetime.timedelta(seconds=30)
+        calls = len(self.controller.paths)
+        self.assertIsNotNone(get_license_usage(sdk))
+        self.assertIn("access_token", self.controller.paths[calls:])
+
+    def test_session_ttl_capped_at_token_expiry(self):
+        self.controller.expires_in = 200
+        sdk = self.api()
+        minter = TokenMinter(lambda tenant: sdk if login_secret(sdk, "client", "secret", tenant,
+                                                                 cache=self.cache) else None)
+        minter.session("1234")
+        deadline = minter._sessions["1234"][1] - time.monotonic()
+        self.assertLessEqual(deadline, 200 - EXPIRY_MARGIN)
+        self.assertGreater(deadline, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
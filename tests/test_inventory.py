@@ -0,0 +1,79 @@
+import unittest
+
+from vfftoken import get_license_usage
+
+
+class Response(object):
+
+    def __init__(self, content=None, status_code=200):
+        self.status_code = status_code
+        self.cgx_status = status_code == 200
+        self.cgx_content = content or {}
+
+
+class Get(object):
+
+    def __init__(self, licenses, statuses):
+        self.licenses = licenses
+        self.statuses = statuses
+
+    def vfflicenses(self):
+        return self.licenses
+
+    def vfflicense_status(self, license_id):
+        return self.statuses[license_id]
+
+
+class SDK(object):
+
+    tenant_id = "1001"
+
+    def __init__(self, licenses, statuses=None):
+        self.get = Get(licenses, statuses or {})
+
+
+def license(license_id, model, allowed):
+    return {"id": license_id, "model": model, "allowed_ions": allowed}
+
+
+class GetLicenseUsageTest(unittest.TestCase):
+
+    def test_usage(self):
+        sdk = SDK(Response({"items": [license("l1", "ion 3102v", 10), license("l2", "ion 3104v", 2)]}),
+                  {"l1": Response({"deployed_ions": 4}), "l2": Response({"deployed_ions": 2})})
+        licenses = get_license_usage(sdk)
+        self.assertFalse(licenses.failed)
+        self.assertEqual(licenses.errors, [])
+        self.assertEqual(licenses.available("ion 3102v"), 6)
+        self.assertEqual(licenses.available("ion 3104v"), 0)
+        self.assertEqual(licenses.license_id("ion 3104v"), "l2")
+        self.assertNotIn("ion 7108v", licenses)
+
+    def test_failed_listing(self):
+        failure = Response(status_code=500)
+        licenses = get_license_usage(SDK(failure))
+        self.assertTrue(licenses.failed)
+        self.assertEqual(len(licenses), 0)
+        self.assertEqual(licenses.errors, ["Could not retrieve VFF Licenses. Status: 500"])
+        self.assertEqual(licenses.failures, [failure])
+
+    def test_no_licenses(self):
+        licenses = get_license_usage(SDK(Response({"items": []})))
+        self.assertFalse(licenses.failed)
+        self.assertEqual(len(licenses), 0)
+
+    def test_failed_status(self):
+        failure = Response(status_code=503)
+        sdk = SDK(Response({"items": [license("l1", "ion 3102v", 10), license("l2", "ion 3104v", 2)]}),
+                  {"l1": failure, "l2": Response({"deployed_ions": 1})})
+        licenses = get_license_usage(sdk)
+        self.assertFalse(licenses.failed)
+        self.assertTrue(licenses.status_failed("ion 3102v"))
+        self.assertEqual(licenses.available("ion 3102v"), 0)
+        self.assertEqual(licenses.available("ion 3104v"), 1)
+        self.assertEqual(licenses.errors, ["Could not retrieve VFF License Status for model ion 3102v"])
+        self.assertEqual(licenses.failures, [failure])
+
+
+if __name__ == "__main__":
+    unittest.main()
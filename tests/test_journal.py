@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from vfftoken import Journal, load_journal, plan_indexes
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "run.journal")
+
+    def test_load_journal_ignores_truncated_line(self):
+        with Journal(self.filename) as journal:
+            journal.record("1001", "ion 3102v", 0, "k0")
+            journal.record("1001", "ion 3102v", 2, "k2")
+            journal.record("1002", "ion 3104v", 0, "k3")
+        with open(self.filename, "a") as f:
+            f.write('{"tenant_id": "1001", "model": "ion 3102v", "ind')
+
+        self.assertEqual(load_journal(self.filename), {("1001", "ion 3102v"): {0, 2},
+                                                       ("1002", "ion 3104v"): {0}})
+
+    def test_journal_appends_across_runs(self):
+        with Journal(self.filename) as journal:
+            journal.record("1001", "ion 3102v", 0, "k0")
+        with Journal(self.filename) as journal:
+            journal.record("1001", "ion 3102v", 1, "k1")
+        self.assertEqual(load_journal(self.filename), {("1001", "ion 3102v"): {0, 1}})
+
+
+class PlanIndexesTest(unittest.TestCase):
+
+    ORDERS = [("ion 3102v", 2, "single"), ("ion 3104v", 1, "multi"), ("ion 3102v", 3, "multi")]
+
+    def test_indexes_run_on_across_orders_of_a_model(self):
+        plan, needed = plan_indexes("1001", self.ORDERS)
+        self.assertEqual(plan, [("ion 3102v", "single", [0, 1]),
+                                ("ion 3104v", "multi", [0]),
+                                ("ion 3102v", "multi", [2, 3, 4])])
+        self.assertEqual(list(needed.items()), [("ion 3102v", 5), ("ion 3104v", 1)])
+
+    def test_resume_skips_completed_indexes(self):
+        completed = {("1001", "ion 3102v"): {0, 3}, ("1002", "ion 3104v"): {0}}
+        plan, needed = plan_indexes("1001", self.ORDERS, completed)
+        self.assertEqual(plan, [("ion 3102v", "single", [1]),
+                                ("ion 3104v", "multi", [0]),
+                                ("ion 3102v", "multi", [2, 4])])
+        self.assertEqual(dict(needed), {"ion 3102v": 3, "ion 3104v": 1})
+
+    def test_resume_of_completed_tenant(self):
+        completed = {("1001", "ion 3102v"): set(range(5)), ("1001", "ion 3104v"): {0}}
+        plan, needed = plan_indexes("1001", self.ORDERS, completed)
+        self.assertFalse(sum(needed.values()))
+        self.assertTrue(all(not indexes for _, _, indexes in plan))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from vfftoken import TokenSink, merge_fields, merge_journals, merge_rows, read_rows
+
+
+class MergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def path(self, name, text):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, "w") as f:
+            f.write(text)
+        return filename
+
+    def test_merge_rows_drops_duplicate_keys(self):
+        first = self.path("a.csv", "tenant_id,model,key,secret\n1001,ion 3102v,k1,s1\n1001,ion 3102v,k2,s2\n")
+        # A .partial left by a crashed shard, with a truncated last line and a key already in the first file
+        second = self.path("b.csv.partial", "tenant_id,model,use,key,secret\n1002,ion 3104v,multi,k2,s2\n"
+                                            "1002,ion 3104v,multi,k3,s3\n")
+        third = self.path("c.jsonl", json.dumps({"tenant_id": "1003", "model": "ion 3102v", "key": "k4",
+                                                 "secret": "s4"}) + "\n" + '{"tenant_id": "1003", "key"')
+        filenames = [first, second, third]
+        output = os.path.join(self.tmpdir, "merged.csv")
+
+        with TokenSink(output, fields=merge_fields(filenames)) as sink:
+            stats = merge_rows(filenames, sink)
+
+        self.assertEqual([row["key"] for row in read_rows(output)], ["k1", "k2", "k3", "k4"])
+        self.assertEqual((stats["rows"], stats["duplicates"]), (4, 1))
+        self.assertEqual(stats["files"][second]["duplicates"], 1)
+        self.assertEqual(stats["tenants"], {"1001", "1002", "1003"})
+        self.assertEqual(stats["models"]["ion 3102v"], 3)
+        self.assertEqual(merge_fields(filenames), ["tenant_id", "model", "key", "secret", "use"])
+
+    def test_merge_rows_without_key_dedupes_on_values(self):
+        filename = self.path("a.csv", "tenant_id,model\n1001,ion 3102v\n1001,ion 3102v\n1001,ion 3104v\n")
+        output = os.path.join(self.tmpdir, "merged.csv")
+        with TokenSink(output, fields=["tenant_id", "model"]) as sink:
+            stats = merge_rows([filename, filename], sink)
+        self.assertEqual((stats["rows"], stats["duplicates"]), (2, 4))
+
+    def test_merge_journals_one_entry_per_slot(self):
+        def entry(tenant_id, index, key):
+            return json.dumps({"tenant_id": tenant_id, "model": "ion 3102v", "index": index, "key": key}) + "\n"
+
+        first = self.path("a.journal", entry("1001", 0, "k1") + entry("1001", 1, "k2"))
+        second = self.path("b.journal", entry("1001", 1, "k2") + entry("1002", 0, "k3") + '{"tenant')
+        output = os.path.join(self.tmpdir, "merged.journal")
+        with TokenSink(output, fields=["tenant_id", "model", "index", "key"]) as sink:
+            stats = merge_journals([first, second], sink)
+        self.assertEqual((stats["entries"], stats["duplicates"]), (3, 1))
+        self.assertEqual(stats["keys"], {"k1", "k2", "k3"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import threading
+import time
+import unittest
+
+from vfftoken import CallScheduler, TokenMinter
+
+
+class Response(object):
+
+    def __init__(self, content=None, status_code=200):
+        self.status_code = status_code
+        self.cgx_status = status_code == 200
+        self.cgx_content = content or {}
+
+
+class Get(object):
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def vfflicenses(self):
+        items = [{"id": model, "model": model, "allowed_ions": allowed}
+                 for model, allowed in self.controller.allowed.items()]
+        return Response({"items": items})
+
+    def vfflicense_status(self, license_id):
+        return Response({"deployed_ions": 0})
+
+
+class Post(object):
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def tokens_vfflicenses(self, vfflicense_id, data):
+        return self.controller.create(vfflicense_id)
+
+
+class Controller(object):
+    """
+    Fake SDK session for one tenant. Token requests listed in fail_on raise IOError after the token is created.
+    """
+
+    def __init__(self, tenant_id, allowed, fail_on=(), delay=0.02):
+        self.tenant_id = tenant_id
+        self.allowed = allowed
+        self.fail_on = fail_on
+        self.delay = delay
+        self.get = Get(self)
+        self.post = Post(self)
+        self.created = []
+        self.inflight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def create(self, license_id):
+        with self._lock:
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+            number = len(self.created)
+            self.created.append("key{}".format(number))
+        time.sleep(self.delay)
+        with self._lock:
+            self.inflight -= 1
+        if number in self.fail_on:
+            raise IOError("connection reset")
+        return Response({"ion_key": "key{}".format(number), "secret_key": "secret{}".format(number)})
+
+
+def minter(*controllers, **kwargs):
+    sessions = dict((controller.tenant_id, controller) for controller in controllers)
+    return TokenMinter(sessions.get, scheduler=CallScheduler(max_retries=0), **kwargs)
+
+
+class MintPipelineTest(unittest.TestCase):
+
+    def test_failed_request_does_not_lose_tokens_in_flight(self):
+        controller = Controller("1001", {"ion 3102v": 10}, fail_on=[0])
+        saved = []
+        result = minter(controller, inflight=8).mint("1001", "3102", count=8, on_token=saved.append)
+
+        self.assertEqual(len(controller.created), 8)
+        self.assertEqual(sorted(token.key for token in saved), controller.created[1:])
+        self.assertEqual(result.status, "partial")
+        self.assertEqual(len(result.errors), 1)
+
+    def test_on_token_error_raised_after_tokens_in_flight_are_saved(self):
+        controller = Controller("1001", {"ion 3102v": 20})
+        saved = []
+
+        def save(token):
+            saved.append(token)
+            if len(saved) == 1:
+                raise IOError("disk full")
+
+        with self.assertRaises(IOError):
+            minter(controller, inflight=4).mint("1001", "3102", count=20, on_token=save)
+
+        # No new request is sent after the error, and every token created reached on_token
+        self.assertLess(len(controller.created), 20)
+        self.assertEqual(sorted(token.key for token in saved), sorted(controller.created))
+
+    def test_requests_in_flight_never_exceed_available(self):
+        controller = Controller("1001", {"ion 3102v": 3})
+        result = minter(controller, inflight=8).mint("1001", "3102", count=3)
+        self.assertEqual(result.status, "ok")
+        self.assertLessEqual(controller.peak, 3)
+
+        controller = Controller("1001", {"ion 3102v": 2})
+        result = minter(controller, inflight=8).mint("1001", "3102", count=3)
+        self.assertEqual(result.status, "skipped")
+        self.assertEqual(controller.created, [])
+
+    def test_tokens_created_count_against_available(self):
+        controller = Controller("1001", {"ion 3102v": 5})
+        tokenminter = minter(controller, inflight=2)
+        self.assertTrue(tokenminter.mint("1001", "3102", count=3).ok)
+        self.assertEqual(tokenminter.available("1001", "3102"), 2)
+        self.assertEqual(tokenminter.mint("1001", "3102", count=3).status, "skipped")
+        self.assertEqual(len(controller.created), 3)
+
+
+class TenantStateTest(unittest.TestCase):
+
+    def test_tenant_without_model_does_not_inherit_previous_tenant(self):
+        first = Controller("1001", {"ion 3102v": 5, "ion 3104v": 2})
+        second = Controller("1002", {"ion 3104v": 4})
+        tokenminter = minter(first, second)
+
+        self.assertTrue(tokenminter.mint("1001", "3102", count=2).ok)
+        result = tokenminter.mint("1002", "3102", count=2)
+        self.assertEqual(result.status, "skipped")
+        self.assertEqual(result.available, 0)
+        self.assertEqual(second.created, [])
+        self.assertEqual(tokenminter.available("1002", "3104"), 4)
+
+    def test_login_failure(self):
+        result = minter(Controller("1001", {"ion 3102v": 5})).mint("1002", "3102")
+        self.assertEqual(result.status, "failed")
+        self.assertEqual(len(result.errors), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
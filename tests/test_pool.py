@@ -0,0 +1,86 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+try:
+    from cryptography.fernet import Fernet
+except ImportError:
+    Fernet = None
+
+from vfftoken import TokenPool, TokenStore
+
+
+def minted(key, tenant_id="1001", model="ion 3102v", use="single"):
+    return {"tenant_id": tenant_id, "model": model, "use": use, "key": key, "secret": "secret-" + key}
+
+
+class TokenPoolRestoreTest(unittest.TestCase):
+
+    def pool(self, store=None):
+        pool = TokenPool(minter=None, multiuse=False, store=store)
+        pool.add_target("1001", "3102")
+        return pool
+
+    def test_restores_configured_pools_only(self):
+        pool = self.pool()
+        rows = [minted("a"), minted("b", model="ion 3104v"), minted("c", use="multi"), minted("d", tenant_id="1002")]
+        self.assertEqual(pool.restore(rows), 1)
+        token = pool.take("1001", "3102")
+        self.assertEqual((token.key, token.secret), ("a", "secret-a"))
+        self.assertIsNone(pool.take("1001", "3102"))
+
+
+@unittest.skipIf(Fernet is None, "cryptography is not installed")
+class TokenPoolStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "pool.db")
+        self.key = Fernet.generate_key()
+
+    def pool(self, store):
+        pool = TokenPool(minter=None, multiuse=False, store=store)
+        pool.add_target("1001", "3102")
+        return pool
+
+    def test_issued_tokens_removed_across_restart(self):
+        with TokenStore(self.filename, key=self.key) as store:
+            store.write(minted("a"))
+            store.write(minted("b"))
+
+        with TokenStore(self.filename, key=self.key) as store:
+            pool = self.pool(store)
+            pool.restore(reversed(list(store.query(secrets=True))))
+            self.assertEqual(pool.take("1001", "3102").key, "a")
+
+        with TokenStore(self.filename, key=self.key) as store:
+            pool = self.pool(store)
+            self.assertEqual(pool.restore(store.query(secrets=True)), 1)
+            self.assertEqual(pool.take("1001", "3102").key, "b")
+            self.assertEqual(list(store.query()), [])
+
+    def test_secrets_not_stored_in_plaintext(self):
+        with TokenStore(self.filename, key=self.key) as store:
+            store.write(minted("a"))
+            self.assertTrue(store.remove("a"))
+            self.assertFalse(store.remove("a"))
+            store.write(minted("b"))
+        for filename in os.listdir(self.tmpdir):
+            with open(os.path.join(self.tmpdir, filename), "rb") as f:
+                self.assertNotIn(b"secret-", f.read(), filename)
+        db = sqlite3.connect(self.filename)
+        self.addCleanup(db.close)
+        self.assertEqual(db.execute("SELECT key FROM tokens").fetchall(), [("b",)])
+
+    def test_not_a_store(self):
+        with open(self.filename, "w") as f:
+            f.write("tenant_id,model,use,key,secret\n1001,ion 3102v,single,a,secret-a\n" * 200)
+        with self.assertRaises(ValueError):
+            TokenStore(self.filename, key=self.key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+from vfftoken import CallScheduler, POST_RETRY_STATUSES
+
+
+class Response(object):
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.cgx_status = 200 <= status_code < 300
+        self.headers = headers or {}
+
+
+class Controller(object):
+    """
+    Returns the given responses in turn. Exceptions in the list are raised.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self):
+        result = self.responses[self.calls]
+        self.calls += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class CallSchedulerTest(unittest.TestCase):
+
+    def scheduler(self, max_retries=3):
+        return CallScheduler(max_retries=max_retries, base_delay=0)
+
+    def test_retries_retryable_status(self):
+        controller = Controller(Response(429), Response(503), Response(200))
+        scheduler = self.scheduler()
+        self.assertEqual(scheduler.call(controller).status_code, 200)
+        self.assertEqual((controller.calls, scheduler.retries), (3, 2))
+
+    def test_client_errors_not_retried(self):
+        controller = Controller(Response(400))
+        self.assertEqual(self.scheduler().call(controller).status_code, 400)
+        self.assertEqual(controller.calls, 1)
+
+    def test_token_creation_not_retried_on_server_error(self):
+        # The controller may have created the token before failing
+        controller = Controller(Response(500), Response(200))
+        resp = self.scheduler().call(controller, retry_statuses=POST_RETRY_STATUSES)
+        self.assertEqual((resp.status_code, controller.calls), (500, 1))
+
+        controller = Controller(Response(429), Response(200))
+        resp = self.scheduler().call(controller, retry_statuses=POST_RETRY_STATUSES)
+        self.assertEqual((resp.status_code, controller.calls), (200, 2))
+
+    def test_last_response_returned_when_retries_exhausted(self):
+        controller = Controller(*[Response(503)] * 5)
+        self.assertEqual(self.scheduler(max_retries=2).call(controller).status_code, 503)
+        self.assertEqual(controller.calls, 3)
+
+        controller = Controller(Response(503), Response(200))
+        self.assertEqual(self.scheduler().call(controller, max_retries=0).status_code, 503)
+
+    def test_retry_if(self):
+        controller = Controller(False, False, True)
+        self.assertTrue(self.scheduler().call(controller, retry_if=lambda result: not result))
+        self.assertEqual(controller.calls, 3)
+
+    def test_connection_errors_retried_then_raised(self):
+        controller = Controller(IOError("reset"), Response(200))
+        self.assertEqual(self.scheduler().call(controller).status_code, 200)
+
+        controller = Controller(IOError("reset"), IOError("reset"))
+        with self.assertRaises(IOError):
+            self.scheduler(max_retries=1).call(controller)
+        self.assertEqual(controller.calls, 2)
+
+    def test_other_exceptions_release_the_slot(self):
+        scheduler = CallScheduler(max_concurrency=2, max_retries=0, base_delay=0)
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                scheduler.call(Controller(ValueError("bad response")))
+        with self.assertRaises(ValueError):
+            scheduler.call(Controller(Response(200)), retry_if=lambda result: int("x"))
+        self.assertEqual(scheduler._inflight, 0)
+        self.assertEqual(scheduler.call(Controller(Response(200))).status_code, 200)
+
+    def test_server_errors_lower_the_limit_without_retry(self):
+        scheduler = CallScheduler(max_concurrency=8, base_delay=0)
+        resp = scheduler.call(Controller(Response(500)), retry_statuses=POST_RETRY_STATUSES)
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(scheduler.limit, 4)
+
+        scheduler = CallScheduler(max_concurrency=8, base_delay=0)
+        scheduler.call(Controller(Response(400)))
+        self.assertEqual(scheduler.limit, 8)
+
+    def test_backoff_honours_retry_after(self):
+        scheduler = CallScheduler(base_delay=1, max_delay=10)
+        self.assertEqual(scheduler.backoff(0, Response(429, {"Retry-After": "3"})), 3)
+        self.assertEqual(scheduler.backoff(0, Response(429, {"Retry-After": "60"})), 10)
+        for attempt in range(6):
+            self.assertLessEqual(scheduler.backoff(attempt, Response(503)), min(10, 2 ** attempt))
+
+
+if __name__ == "__main__":
+    unittest.main()
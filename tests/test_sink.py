@@ -0,0 +1,98 @@
+import csv
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from vfftoken import TokenSink
+
+
+def row(index):
+    return {"tenant_id": "1001", "model": "ion 3102v", "use": "multi", "key": "key{}".format(index),
+            "secret": "secret{}".format(index)}
+
+
+def read_csv(filename):
+    with open(filename, "r", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class TokenSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "out.csv")
+        self.partial = "{}.partial".format(self.filename)
+
+    def test_rows_go_to_partial_until_commit(self):
+        sink = TokenSink(self.filename)
+        sink.write(row(1))
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual([r["key"] for r in read_csv(self.partial)], ["key1"])
+        self.assertEqual(stat.S_IMODE(os.stat(self.partial).st_mode), 0o600)
+
+        sink.close()
+        self.assertFalse(os.path.exists(self.partial))
+        self.assertEqual(sink.count, 1)
+        self.assertEqual(read_csv(self.filename)[0]["secret"], "secret1")
+
+    def test_failed_run_leaves_partial(self):
+        with self.assertRaises(RuntimeError):
+            with TokenSink(self.filename) as sink:
+                sink.write(row(1))
+                raise RuntimeError("crash")
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(len(read_csv(self.partial)), 1)
+
+    def test_append_keeps_rows_of_crashed_run(self):
+        TokenSink(self.filename).write(row(1))
+        # A crash while writing can leave an incomplete last line
+        with open(self.partial, "a") as f:
+            f.write("1001,ion 3102v,multi,key2")
+
+        with TokenSink(self.filename, append=True) as sink:
+            sink.write(row(3))
+        self.assertEqual([r["key"] for r in read_csv(self.filename)], ["key1", "key2", "key3"])
+        self.assertEqual(sink.count, 1)
+
+    def test_append_keeps_rows_of_completed_run(self):
+        with TokenSink(self.filename) as sink:
+            sink.write(row(1))
+        with TokenSink(self.filename, append=True) as sink:
+            sink.write(row(2))
+        self.assertEqual([r["key"] for r in read_csv(self.filename)], ["key1", "key2"])
+
+    def test_append_refuses_two_earlier_files(self):
+        with TokenSink(self.filename) as sink:
+            sink.write(row(1))
+        TokenSink(self.filename).write(row(2))
+        with self.assertRaises(ValueError):
+            TokenSink(self.filename, append=True)
+
+    def test_use_column(self):
+        with TokenSink(self.filename) as sink:
+            sink.write(row(1))
+        self.assertEqual(read_csv(self.filename)[0]["use"], "multi")
+
+    def test_append_keeps_columns_of_earlier_file(self):
+        with open(self.filename, "w") as f:
+            f.write("tenant_id,model,key,secret\n1001,ion 3102v,key1,secret1\n")
+        with TokenSink(self.filename, append=True) as sink:
+            sink.write(row(2))
+        self.assertEqual([(r["key"], r["secret"]) for r in read_csv(self.filename)],
+                         [("key1", "secret1"), ("key2", "secret2")])
+
+    def test_jsonl(self):
+        filename = os.path.join(self.tmpdir, "out.jsonl")
+        with TokenSink(filename) as sink:
+            sink.write(row(1))
+        with TokenSink(filename, append=True) as sink:
+            sink.write(row(2))
+        with open(filename) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from vfftoken import SpecRow, read_spec
+
+
+class ReadSpecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "spec.csv")
+
+    def read(self, text, allowed_models=None):
+        with open(self.filename, "w") as f:
+            f.write(text)
+        return read_spec(self.filename, allowed_models=allowed_models)
+
+    def test_rows_grouped_by_tenant_and_merged(self):
+        spec = self.read("tsg_id, model, count, use\n"
+                         "1002,ion 3102v,1,single\n"
+                         "1001,ion 3102v,2,single\n"
+                         "1002,ion 3102v,3,Single\n"
+                         "1002,ion 3102v,1,multi\n"
+                         ",ion 3104v,1,single\n"
+                         "1001,ion 3104v,4,multi\n")
+        self.assertEqual(list(spec.keys()), ["1002", "1001"])
+        self.assertEqual(spec["1002"], [SpecRow("ion 3102v", 4, "single"), SpecRow("ion 3102v", 1, "multi")])
+        self.assertEqual(spec["1001"], [SpecRow("ion 3102v", 2, "single"), SpecRow("ion 3104v", 4, "multi")])
+
+    def test_invalid_rows(self):
+        header = "tsg_id,model,count,use\n"
+        for text in ["tsg_id,model,count\n1001,ion 3102v,1\n",
+                     header + "1001,ion 3102v,0,single\n",
+                     header + "1001,ion 3102v,x,single\n",
+                     header + "1001,ion 3102v,1,double\n"]:
+            with self.assertRaises(ValueError, msg=text):
+                self.read(text)
+        with self.assertRaises(ValueError):
+            self.read(header + "1001,ion 9999v,1,single\n", allowed_models=["ion 3102v"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import unittest
+
+try:
+    from cryptography.fernet import Fernet
+except ImportError:
+    Fernet = None
+
+from vfftoken import TokenStore, new_run_id
+
+
+def row(index, tenant_id="1001", model="ion 3102v"):
+    return {"tenant_id": tenant_id, "model": model, "use": "multi", "key": "key{}".format(index),
+            "secret": "secret{}".format(index)}
+
+
+@unittest.skipIf(Fernet is None, "cryptography is not installed")
+class TokenStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "tokens.db")
+        self.key = Fernet.generate_key()
+
+    def test_token_committed_on_write(self):
+        store = TokenStore(self.filename, key=self.key)
+        self.addCleanup(store.close)
+        store.write(row(1))
+
+        # Another connection sees the token before the store is closed
+        db = sqlite3.connect(self.filename)
+        self.addCleanup(db.close)
+        self.assertEqual(db.execute("SELECT key FROM tokens").fetchall(), [("key1",)])
+        self.assertEqual(stat.S_IMODE(os.stat(self.filename).st_mode), 0o600)
+
+    def test_query_filters_and_decrypts(self):
+        with TokenStore(self.filename, key=self.key, run_id="run1") as store:
+            store.write(row(1))
+            store.write(row(2, model="ion 3104v"))
+            store.write(row(1))
+        with TokenStore(self.filename, key=self.key, run_id="run2") as store:
+            store.write(row(3, tenant_id="1002"))
+
+            self.assertEqual([token["key"] for token in store.query()], ["key3", "key2", "key1"])
+            self.assertEqual([token["key"] for token in store.query(model="ion 3104v")], ["key2"])
+            self.assertEqual([token["key"] for token in store.query(run_id="run2")], ["key3"])
+            self.assertEqual([token["secret"] for token in store.query(key="key1", secrets=True)], ["secret1"])
+            self.assertIsNone(next(store.query(key="key1"))["secret"])
+
+    def test_duplicate_key_not_counted(self):
+        with TokenStore(self.filename, key=self.key) as store:
+            store.write(row(1))
+            store.write(row(1))
+            store.write(row(2))
+        self.assertEqual(store.count, 2)
+
+    def test_run_ids_unique_within_a_second(self):
+        run_ids = set(new_run_id() for _ in range(20))
+        self.assertEqual(len(run_ids), 20)
+
+    def test_wrong_key(self):
+        with TokenStore(self.filename, key=self.key) as store:
+            store.write(row(1))
+        with TokenStore(self.filename, key=Fernet.generate_key()) as store:
+            with self.assertRaises(ValueError):
+                list(store.query(secrets=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
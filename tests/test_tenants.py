@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from vfftoken import TenantReader, in_shard, parse_shard, shard_of
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_shard_of_is_stable(self):
+        # Pinned values: a change here moves tenants between the hosts of an existing sharded run
+        self.assertEqual([shard_of(str(tsg_id), 4) for tsg_id in range(1000000001, 1000000009)],
+                         [1, 1, 1, 4, 4, 1, 1, 2])
+        self.assertEqual(shard_of(" 1000000004\n", 4), shard_of(1000000004, 4))
+
+    def test_shards_are_disjoint_and_complete(self):
+        tenants = [str(tsg_id) for tsg_id in range(1000, 1200)]
+        shards = [list(in_shard(tenants, index, 3)) for index in range(1, 4)]
+        self.assertEqual(sorted(sum(shards, [])), tenants)
+        self.assertTrue(all(shards))
+        self.assertEqual(list(in_shard(tenants, 1, 1)), tenants)
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        for shard in ["0/4", "5/4", "1/0", "1", "a/b", "1/2/3"]:
+            with self.assertRaises(ValueError, msg=shard):
+                parse_shard(shard)
+
+
+class TenantReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "tenants.csv")
+
+    def write(self, text):
+        with open(self.filename, "w") as f:
+            f.write(text)
+
+    def test_skips_blank_and_duplicate_ids(self):
+        self.write("name, tsg_id\na,1001\nb, 1002\nc,\nd,1001\ne\n")
+        self.assertEqual(list(TenantReader(self.filename)), ["1001", "1002"])
+
+    def test_missing_column(self):
+        self.write("name,id\na,1001\n")
+        with self.assertRaises(ValueError):
+            TenantReader(self.filename)
+
+if __name__ == "__main__":
+    unittest.main()
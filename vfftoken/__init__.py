@@ -0,0 +1,77 @@
+"""
+Shared helpers for the Prisma SDWAN VFF token scripts
+"""
+from .inventory import INVENTORY_FIELDS, INVENTORY_TYPES, STATUS_WORKERS, LicenseUsage, LicenseInventory, get_license_usage
+from .authcache import AuthTokenCache, login_secret
+from .sink import TokenSink, MultiSink
+from .tenants import TenantReader, list_children, parse_shard, shard_of, in_shard
+from .workers import run_bounded
+from .journal import JOURNAL_FIELDS, Journal, read_journal, load_journal, plan_indexes
+from .ratelimit import CallScheduler, TokenBucket, RETRY_STATUSES, POST_RETRY_STATUSES
+from .metrics import Metrics
+from .minter import MODEL_MAP, INFLIGHT, Token, MintResult, TokenMinter, ion_model
+from .pool import TokenPool, make_server
+from .spec import SpecRow, read_spec
+from .connpool import shared_adapter, share_connections
+from .store import STORE_KEY_ENV, STORE_FIELDS, TokenStore, new_run_id, store_cipher
+from .audit import AUDIT_FIELDS, STATES, created_on, iter_tokens, revoke_token, token_filter
+from .merge import merge_fields, merge_rows, merge_journals, read_rows
+from .profiling import Profiler, NO_PROFILE
+
+__all__ = [
+    "INVENTORY_FIELDS",
+    "INVENTORY_TYPES",
+    "STATUS_WORKERS",
+    "LicenseUsage",
+    "LicenseInventory",
+    "get_license_usage",
+    "AuthTokenCache",
+    "login_secret",
+    "TokenSink",
+    "MultiSink",
+    "TenantReader",
+    "list_children",
+    "parse_shard",
+    "shard_of",
+    "in_shard",
+    "run_bounded",
+    "JOURNAL_FIELDS",
+    "Journal",
+    "read_journal",
+    "load_journal",
+    "plan_indexes",
+    "CallScheduler",
+    "TokenBucket",
+    "RETRY_STATUSES",
+    "POST_RETRY_STATUSES",
+    "Metrics",
+    "MODEL_MAP",
+    "INFLIGHT",
+    "Token",
+    "MintResult",
+    "TokenMinter",
+    "ion_model",
+    "TokenPool",
+    "make_server",
+    "SpecRow",
+    "read_spec",
+    "shared_adapter",
+    "share_connections",
+    "STORE_KEY_ENV",
+    "STORE_FIELDS",
+    "TokenStore",
+    "new_run_id",
+    "store_cipher",
+    "AUDIT_FIELDS",
+    "STATES",
+    "created_on",
+    "iter_tokens",
+    "revoke_token",
+    "token_filter",
+    "merge_fields",
+    "merge_rows",
+    "merge_journals",
+    "read_rows",
+    "Profiler",
+    "NO_PROFILE",
+]
@@ -0,0 +1,144 @@
+"""
+Listing and revocation of existing VFF tokens
+"""
+import time
+
+from .ratelimit import DIRECT
+
+# Tokens requested per page of the token query
+PAGE_SIZE = 100
+
+# Token states that can be filtered on
+STATES = ["used", "unused", "expired", "revoked"]
+
+AUDIT_FIELDS = ["tenant_id", "model", "license_id", "token_id", "key", "use", "is_used", "is_expired",
+                "is_revoked", "created_on", "action"]
+
+# Token API names of the prisma_sase and cloudgenix SDKs, followed by their backwards-compatibility aliases
+QUERY_METHODS = ["vff_token_query", "query_tokens_vfflicenses"]
+TOKEN_METHODS = ["vfflicense_tokens", "tokens_vfflicenses"]
+
+
+def sdk_method(namespace, names):
+    """
+    :return: The first of names that the SDK namespace (ex. sdk.post) provides, or None
+    """
+    for name in names:
+        func = getattr(namespace, name, None)
+        if func is not None:
+            return func
+    return None
+
+
+def created_on(token):
+    """
+    :return: Token creation time in seconds since the epoch, or None if unknown
+    """
+    value = token.get("_created_on_utc", None)
+    if not value:
+        return None
+    value = float(value)
+    # The controller reports creation time in units finer than seconds
+    for divisor in [1.0, 1e3, 1e6, 1e7]:
+        if value / divisor < 1e10:
+            return value / divisor
+    return None
+
+
+def token_state(token):
+    """
+    :return: Set of STATES that apply to the token
+    """
+    states = set()
+    states.add("used" if token.get("is_used") else "unused")
+    if token.get("is_expired"):
+        states.add("expired")
+    if token.get("is_revoked"):
+        states.add("revoked")
+    return states
+
+
+def token_filter(states=None, older_than=None, use=None, now=None):
+    """
+    Build a predicate on token dicts. All given conditions must hold.
+    :param states: Token matches if it is in any of these STATES. Revoked tokens only match if revoked is listed
+    :param older_than: Seconds. Token matches if it was created at least this long ago
+    :param use: single or multi
+    :return: Function taking a token dict and returning True if it matches
+    """
+    states = set(states or [])
+    now = now or time.time()
+
+    def match(token):
+        tokenstates = token_state(token)
+        if "revoked" in tokenstates and "revoked" not in states:
+            return False
+        if states and not (states & tokenstates):
+            return False
+        if use is not None and bool(token.get("is_multiuse")) != (use == "multi"):
+            return False
+        if older_than is not None:
+            created = created_on(token)
+            if created is None or now - created < older_than:
+                return False
+        return True
+
+    return match
+
+
+def iter_tokens(sdk, license_id, page_size=PAGE_SIZE, scheduler=None):
+    """
+    Page through the tokens of a license. Pages are requested one at a time as the caller consumes them.
+    Falls back to a single unpaged list if the SDK has no token query.
+    :param sdk: Authenticated SDK session
+    :param license_id: VFF license ID
+    :return: Generator of token dicts. Raises IOError if a page cannot be read
+    """
+    scheduler = scheduler or DIRECT
+    query = sdk_method(sdk.post, QUERY_METHODS)
+    if query is None:
+        resp = scheduler.call(sdk_method(sdk.get, TOKEN_METHODS), license_id, endpoint="tokens_vfflicenses_list",
+                              tenant=sdk.tenant_id)
+        if not resp.cgx_status:
+            raise IOError("Could not list tokens of license {}. Status: {}".format(
+                license_id, getattr(resp, "status_code", None)))
+        for token in resp.cgx_content.get("items", None) or []:
+            yield token
+        return
+
+    seen = set()
+    page = 1
+    while True:
+        data = {
+            "limit": page_size,
+            "dest_page": page,
+            "query_params": {"vfflicense_id": {"eq": license_id}},
+            "sort_params": {"id": "asc"}
+        }
+        resp = scheduler.call(query, data=data, endpoint="tokens_vfflicenses_query", tenant=sdk.tenant_id)
+        if not resp.cgx_status:
+            raise IOError("Could not list tokens of license {}. Status: {}".format(
+                license_id, getattr(resp, "status_code", None)))
+
+        items = resp.cgx_content.get("items", None) or []
+        new = [token for token in items if token.get("id") not in seen]
+        for token in new:
+            seen.add(token.get("id"))
+            yield token
+
+        total = resp.cgx_content.get("total_count", None)
+        if not new or len(items) < page_size or (total is not None and len(seen) >= total):
+            return
+        page += 1
+
+
+def revoke_token(sdk, token, scheduler=None):
+    """
+    Revoke a token
+    :return: SDK response
+    """
+    scheduler = scheduler or DIRECT
+    data = dict(token)
+    data["is_revoked"] = True
+    return scheduler.call(sdk_method(sdk.put, TOKEN_METHODS), token["vfflicense_id"], token["id"], data=data,
+                          endpoint="tokens_vfflicenses_revoke", tenant=sdk.tenant_id)
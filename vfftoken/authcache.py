@@ -0,0 +1,184 @@
+"""
+Service Account access token cache keyed by (client_id, tsg_id)
+"""
+import base64
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .ratelimit import DIRECT
+
+# Prisma SASE access tokens are valid for 15 minutes. Used when the token expiry cannot be read.
+DEFAULT_TTL = 900
+# Tokens this close to expiry are not handed out
+EXPIRY_MARGIN = 60
+# Session headers set by login_secret that must be restored with a cached token
+AUTH_HEADERS = ["Authorization", "X-PANW-Region"]
+# SDK attributes set by login_secret that must be restored with a cached token. The SDK sets the
+# X-PANW-Region header from panw_region on every call.
+SESSION_ATTRIBUTES = ["tenant_id", "tenant_name", "panw_region", "is_esp", "controller_region"]
+
+
+def token_expiry(access_token, default_ttl=DEFAULT_TTL):
+    """
+    Read the exp claim from a JWT access token without verifying it.
+    :return: Expiry as a unix timestamp. now + default_ttl if the token cannot be decoded.
+    """
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode("ascii")).decode("utf-8"))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + default_ttl
+
+
+class AuthTokenCache(object):
+    """
+    In-process cache of Service Account access tokens, optionally backed by a file readable only by the owner.
+    The file is re-read on a miss so parallel runs can pick up each other's tokens.
+    """
+
+    def __init__(self, filename=None, default_ttl=DEFAULT_TTL, margin=EXPIRY_MARGIN):
+        self.filename = filename
+        self.default_ttl = default_ttl
+        self.margin = margin
+        self._entries = {}
+        self._lock = threading.Lock()
+        if self.filename:
+            self._entries.update(self._load())
+
+    @staticmethod
+    def _key(client_id, tsg_id):
+        return "{}|{}".format(client_id, tsg_id)
+
+    def _valid(self, entry):
+        return entry is not None and entry.get("expires_at", 0) - self.margin > time.time()
+
+    def _load(self):
+        try:
+            with open(self.filename, "r") as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def _save(self):
+        #
+        # Merge with entries written by other runs, drop expired ones and replace the file atomically
+        #
+        entries = self._load()
+        entries.update(self._entries)
+        entries = dict((key, entry) for key, entry in entries.items() if self._valid(entry))
+
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmpname = tempfile.mkstemp(prefix=".authcache", dir=dirname)
+        try:
+            os.chmod(tmpname, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmpname, self.filename)
+        except Exception:
+            os.unlink(tmpname)
+            raise
+
+    def get(self, client_id, tsg_id):
+        """
+        :return: Cached entry with headers, tenant_id and expires_at, or None if missing or expiring
+        """
+        key = self._key(client_id, tsg_id)
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if not self._valid(entry) and self.filename:
+                entry = self._load().get(key, None)
+                if self._valid(entry):
+                    self._entries[key] = entry
+            return entry if self._valid(entry) else None
+
+    def put(self, client_id, tsg_id, headers, attributes, expires_at=None):
+        """
+        :param attributes: Dict of SESSION_ATTRIBUTES of the logged in SDK session
+        """
+        if expires_at is None:
+            expires_at = time.time() + self.default_ttl
+        entry = {
+            "headers": headers,
+            "attributes": attributes,
+            "expires_at": expires_at
+        }
+        with self._lock:
+            self._entries[self._key(client_id, tsg_id)] = entry
+            if self.filename:
+                self._save()
+
+    def invalidate(self, client_id, tsg_id):
+        with self._lock:
+            self._entries.pop(self._key(client_id, tsg_id), None)
+
+
+def session_expires_in(sdk):
+    """
+    :return: Seconds until the access token of an SDK session expires, or None if the SDK does not track it
+    """
+    expires_at = getattr(sdk, "jwt_expires_at", None)
+    if not isinstance(expires_at, datetime.datetime):
+        return None
+    return (expires_at - datetime.datetime.now()).total_seconds()
+
+
+def restore_session(sdk, entry, client_id, client_secret, tsg_id):
+    """
+    Authenticate an SDK session with a cached access token. The credentials and token expiry are restored as
+    login_secret would set them, so the SDK logs in again by itself once the token is about to expire.
+    """
+    sdk.add_headers(entry["headers"])
+    attributes = entry.get("attributes", None) or {"tenant_id": entry.get("tenant_id", None)}
+    for name, value in attributes.items():
+        setattr(sdk, name, value)
+    sdk.client_id = client_id
+    sdk.client_secret = client_secret
+    sdk.tsg_id = tsg_id
+    sdk.grant_type = "client_credentials"
+    sdk.scope = "tsg_id:{0} email profile".format(tsg_id)
+    sdk.jwt_expires_at = datetime.datetime.now() + datetime.timedelta(seconds=entry["expires_at"] - time.time())
+    sdk.use_jwt = False
+
+
+def login_secret(sdk, client_id, client_secret, tsg_id, cache=None, scheduler=None):
+    """
+    Login to a TSG with Service Account credentials, reusing an unexpired access token from the cache if present.
+    :param sdk: prisma_sase API session
+    :param cache: AuthTokenCache or None to always login
+    :param scheduler: CallScheduler used for the login call
+    :return: True if the session is authenticated
+    """
+    if cache is not None:
+        entry = cache.get(client_id, tsg_id)
+        if entry is not None:
+            restore_session(sdk, entry, client_id, client_secret, tsg_id)
+            return True
+
+    #
+    # login_secret does not return the response, so a failed login is retried a couple of times
+    # without telling throttling apart from bad credentials
+    #
+    (scheduler or DIRECT).call(sdk.interactive.login_secret, client_id=client_id, client_secret=client_secret,
+                               tsg_id=tsg_id, retry_if=lambda result: sdk.tenant_id is None, max_retries=2,
+                               endpoint="login_secret", tenant=tsg_id)
+    if sdk.tenant_id is None:
+        return False
+
+    if cache is not None:
+        headers = dict((name, sdk._session.headers[name]) for name in AUTH_HEADERS if name in sdk._session.headers)
+        attributes = dict((name, getattr(sdk, name, None)) for name in SESSION_ATTRIBUTES)
+        authorization = headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            cache.put(client_id, tsg_id, headers, attributes,
+                      expires_at=token_expiry(authorization[len("Bearer "):], cache.default_ttl))
+
+    return True
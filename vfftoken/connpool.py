@@ -0,0 +1,45 @@
+"""
+Keep-alive connection pool shared by per-tenant SDK sessions
+"""
+
+
+def shared_adapter(pool_maxsize, sdk=None, pool_connections=4):
+    """
+    Create a requests HTTPAdapter to mount on every SDK session of a run.
+    The adapter owns the urllib3 pool manager, so sessions that share it reuse TCP/TLS connections to the
+    controller, while headers, cookies and tokens stay per session.
+    :param pool_maxsize: Connections kept alive per host. Size to the number of calls in flight.
+    :param sdk: SDK session whose adapter class, SSL context and retry settings the adapter should keep
+    :param pool_connections: Number of hosts to keep pools for (controller and auth endpoints)
+    :return: HTTPAdapter, or None if requests is not available
+    """
+    try:
+        import requests.adapters
+    except ImportError:
+        return None
+
+    adapter_class = requests.adapters.HTTPAdapter
+    kwargs = {"max_retries": 0}
+    session = getattr(sdk, "_session", None)
+    if session is not None and hasattr(session, "get_adapter"):
+        # Keep the SDK's own adapter class (prisma_sase mounts a TLS adapter carrying its ssl_context)
+        current = session.get_adapter("https://")
+        kwargs["max_retries"] = current.max_retries
+        if getattr(current, "ssl_context", None) is not None:
+            adapter_class = type(current)
+            kwargs["ssl_context"] = current.ssl_context
+
+    return adapter_class(pool_connections=pool_connections, pool_maxsize=pool_maxsize, **kwargs)
+
+
+def share_connections(sdk, adapter):
+    """
+    Mount the shared adapter on an SDK session
+    :return: True if the adapter was mounted
+    """
+    session = getattr(sdk, "_session", None)
+    if adapter is None or session is None or not hasattr(session, "mount"):
+        return False
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return True
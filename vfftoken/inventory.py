@@ -0,0 +1,119 @@
+"""
+VFF license inventory for a tenant
+"""
+import collections
+import concurrent.futures
+
+from .ratelimit import DIRECT
+
+# Number of vfflicense_status calls issued in parallel per tenant
+STATUS_WORKERS = 8
+
+# Columns of the inventory report and their Parquet types
+INVENTORY_FIELDS = ["tenant_id", "model", "license_id", "allowed_count", "deployed_count", "available_count", "status"]
+INVENTORY_TYPES = {"allowed_count": "int64", "deployed_count": "int64", "available_count": "int64"}
+
+LicenseUsage = collections.namedtuple("LicenseUsage", ["model", "license_id", "allowed_count",
+                                                       "deployed_count", "available_count"])
+
+
+class LicenseInventory(object):
+    """
+    Per-model snapshot of VFF license usage for one tenant.
+    Models whose status could not be retrieved have deployed_count and available_count set to None.
+    failed is True if the licenses could not be listed. The inventory is then empty, though the tenant may have
+    licenses.
+    errors holds a message for each failed lookup, and failures the SDK responses, for the caller to report.
+    """
+
+    def __init__(self, licenses=None, failed=False, errors=None, failures=None):
+        self.licenses = collections.OrderedDict()
+        for usage in licenses or []:
+            self.licenses[usage.model] = usage
+        self.failed = failed
+        self.errors = list(errors or [])
+        self.failures = list(failures or [])
+
+    def __contains__(self, model):
+        return model in self.licenses
+
+    def __iter__(self):
+        return iter(self.licenses.values())
+
+    def __len__(self):
+        return len(self.licenses)
+
+    def get(self, model):
+        return self.licenses.get(model, None)
+
+    def license_id(self, model):
+        usage = self.licenses.get(model, None)
+        return usage.license_id if usage else None
+
+    def status_failed(self, model):
+        """
+        :return: True if the model has a license whose status could not be retrieved
+        """
+        usage = self.licenses.get(model, None)
+        return usage is not None and usage.available_count is None
+
+    def available(self, model):
+        """
+        Number of licenses available for the model. Unknown models and failed status lookups count as 0.
+        """
+        usage = self.licenses.get(model, None)
+        if usage is None or usage.available_count is None:
+            return 0
+        return usage.available_count
+
+
+def get_license_usage(sdk, max_workers=STATUS_WORKERS, scheduler=None):
+    """
+    Retrieve VFF License count for each ION model.
+    vfflicense_status is fetched concurrently for all licenses returned by vfflicenses.
+    :param sdk: Authenticated cloudgenix or prisma_sase API session
+    :param max_workers: Maximum number of concurrent vfflicense_status calls
+    :param scheduler: CallScheduler used for the controller calls
+    :return: LicenseInventory, with failed set if the licenses could not be listed. Failed lookups are in its
+             errors and failures.
+    """
+    scheduler = scheduler or DIRECT
+    resp = scheduler.call(sdk.get.vfflicenses, endpoint="vfflicenses", tenant=sdk.tenant_id)
+    if not resp.cgx_status:
+        return LicenseInventory(failed=True, errors=["Could not retrieve VFF Licenses. Status: {}".format(
+            getattr(resp, "status_code", None))], failures=[resp])
+
+    licenselist = resp.cgx_content.get("items", None) or []
+    if not licenselist:
+        return LicenseInventory()
+
+    #
+    # Get usage information
+    #
+    workers = max(1, min(max_workers, len(licenselist)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        statuslist = list(executor.map(lambda license: scheduler.call(sdk.get.vfflicense_status, license["id"],
+                                                                      endpoint="vfflicense_status",
+                                                                      tenant=sdk.tenant_id),
+                                       licenselist))
+
+    usagelist = []
+    errors = []
+    failures = []
+    for license, resp in zip(licenselist, statuslist):
+        deployed_count = None
+        available_count = None
+        if resp.cgx_status:
+            deployed_count = resp.cgx_content.get("deployed_ions")
+            available_count = license["allowed_ions"] - deployed_count
+        else:
+            errors.append("Could not retrieve VFF License Status for model {}".format(license["model"]))
+            failures.append(resp)
+
+        usagelist.append(LicenseUsage(model=license["model"],
+                                      license_id=license["id"],
+                                      allowed_count=license["allowed_ions"],
+                                      deployed_count=deployed_count,
+                                      available_count=available_count))
+
+    return LicenseInventory(usagelist, errors=errors, failures=failures)
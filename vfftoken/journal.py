@@ -0,0 +1,97 @@
+"""
+Checkpoint journal for batch token runs
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+
+class Journal(object):
+    """
+    Append-only JSONL record of each token created, one line per (tenant_id, model, index).
+    Each line is flushed and synced before record() returns. Secrets are not written to the journal.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._file = os.fdopen(fd, "a")
+
+    def record(self, tenant_id, model, index, key):
+        entry = {
+            "tenant_id": tenant_id,
+            "model": model,
+            "index": index,
+            "key": key,
+            "time": time.time()
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+JOURNAL_FIELDS = ["tenant_id", "model", "index", "key", "time"]
+
+
+def read_journal(filename):
+    """
+    Read the entries of a journal. A truncated last line from a crashed run is ignored.
+    :return: Generator of entry dicts with JOURNAL_FIELDS
+    """
+    with open(filename, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            yield entry
+
+
+def load_journal(filename):
+    """
+    Read the completed token indexes from a journal. A truncated last line from a crashed run is ignored.
+    :return: Dict of (tenant_id, model) to the set of completed token indexes
+    """
+    completed = {}
+    for entry in read_journal(filename):
+        completed.setdefault((entry["tenant_id"], entry["model"]), set()).add(entry["index"])
+    return completed
+
+
+def plan_indexes(tenant_id, orders, completed=None):
+    """
+    Plan the token indexes to create for a tenant.
+    Indexes run on across all orders for the same model, so a resumed run lines up with the journal.
+    :param orders: List of (model, number of tokens, use)
+    :param completed: Dict of (tenant_id, model) to completed indexes, as returned by load_journal
+    :return: (plan, needed). plan is a list of (model, use, indexes still to create) per order,
+             needed an OrderedDict of model to the number of tokens still to create
+    """
+    completed = completed or {}
+    plan = []
+    needed = collections.OrderedDict()
+    offsets = {}
+    for model, num, use in orders:
+        start = offsets.get(model, 0)
+        offsets[model] = start + num
+        done = completed.get((tenant_id, model), set())
+        indexes = [index for index in range(start, start + num) if index not in done]
+        plan.append((model, use, indexes))
+        needed[model] = needed.get(model, 0) + len(indexes)
+    return plan, needed
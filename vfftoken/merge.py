@@ -0,0 +1,124 @@
+"""
+Merge of per-shard token files and journals
+"""
+import collections
+import csv
+import json
+
+from .journal import read_journal
+from .sink import output_format
+
+PARTIAL_SUFFIX = ".partial"
+
+
+def file_format(filename):
+    """
+    :return: csv or jsonl. A .partial file has the format of the file it was written for
+    """
+    if filename.endswith(PARTIAL_SUFFIX):
+        filename = filename[:-len(PARTIAL_SUFFIX)]
+    format = output_format(filename)
+    if format not in ["csv", "jsonl"]:
+        raise ValueError("Cannot merge {} files: {}".format(format, filename))
+    return format
+
+
+def read_fields(filename):
+    """
+    :return: Column names of a CSV or JSONL file, from its header or first row
+    """
+    with open(filename, "r", newline="", encoding="utf-8") as f:
+        if file_format(filename) == "csv":
+            return next(csv.reader(f), [])
+        for line in f:
+            try:
+                return list(json.loads(line).keys())
+            except ValueError:
+                continue
+    return []
+
+
+def read_rows(filename):
+    """
+    Read the rows of a CSV or JSONL file. A truncated last line from a crashed run is ignored.
+    :return: Generator of row dicts
+    """
+    with open(filename, "r", newline="", encoding="utf-8") as f:
+        if file_format(filename) == "csv":
+            for row in csv.DictReader(f):
+                yield row
+            return
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def merge_fields(filenames):
+    """
+    :return: Union of the columns of all files, in the order first seen
+    """
+    fields = []
+    for filename in filenames:
+        for field in read_fields(filename):
+            if field not in fields:
+                fields.append(field)
+    return fields
+
+
+def merge_rows(filenames, sink, key_field="key"):
+    """
+    Write the rows of all files to sink, dropping rows whose key_field was already written.
+    Rows without key_field are deduplicated on all of their values.
+    :return: Dict with per file counts (files), rows, duplicates, tenants and models, and the set of keys written
+    """
+    seen = set()
+    stats = {
+        "files": collections.OrderedDict(),
+        "rows": 0,
+        "duplicates": 0,
+        "tenants": set(),
+        "models": collections.Counter()
+    }
+    for filename in filenames:
+        filestats = stats["files"][filename] = collections.Counter()
+        for row in read_rows(filename):
+            filestats["read"] += 1
+            key = row.get(key_field, None) or tuple(sorted((k, str(v)) for k, v in row.items()))
+            if key in seen:
+                filestats["duplicates"] += 1
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            sink.write(row)
+            filestats["written"] += 1
+            stats["rows"] += 1
+            if row.get("tenant_id", None):
+                stats["tenants"].add(row["tenant_id"])
+            if row.get("model", None):
+                stats["models"][row["model"]] += 1
+    stats["keys"] = seen
+    return stats
+
+
+def merge_journals(filenames, sink):
+    """
+    Write the entries of all journals to sink, one per (tenant_id, model, index)
+    :return: Dict with entries, duplicates and the set of keys written
+    """
+    seen = set()
+    keys = set()
+    stats = {"entries": 0, "duplicates": 0}
+    for filename in filenames:
+        for entry in read_journal(filename):
+            slot = (entry["tenant_id"], entry["model"], entry["index"])
+            if slot in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(slot)
+            keys.add(entry.get("key", None))
+            sink.write(entry)
+            stats["entries"] += 1
+    stats["keys"] = keys
+    return stats
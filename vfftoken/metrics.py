@@ -0,0 +1,188 @@
+"""
+Per-call timing and counters for controller calls
+"""
+import json
+import os
+import threading
+import time
+
+# Upper bounds in seconds of the call latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        """
+        :return: List of (upper bound, cumulative count) as used by Prometheus
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics(object):
+    """
+    Thread safe counters for a run: calls, errors, retries and latency per endpoint,
+    calls and time per tenant, and tokens created per model.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.endpoints = {}
+        self.tenants = {}
+        self.tokens = {}
+        self._lock = threading.Lock()
+
+    def _tenant(self, tenant):
+        return self.tenants.setdefault(str(tenant), {"calls": 0, "errors": 0, "call_seconds": 0.0, "seconds": None,
+                                                     "tokens": 0, "status": None})
+
+    def observe_call(self, endpoint, tenant, seconds, ok, retry=False):
+        """
+        Record one attempt of a controller call. retry marks attempts after the first.
+        """
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0,
+                                                         "histogram": Histogram()})
+            stats["calls"] += 1
+            stats["histogram"].observe(seconds)
+            if not ok:
+                stats["errors"] += 1
+            if retry:
+                stats["retries"] += 1
+
+            if tenant is not None:
+                tenantstats = self._tenant(tenant)
+                tenantstats["calls"] += 1
+                tenantstats["call_seconds"] += seconds
+                if not ok:
+                    tenantstats["errors"] += 1
+
+    def observe_tenant(self, tenant, seconds, status):
+        """
+        Record the wall clock time and outcome (ok, skipped or failed) of a tenant
+        """
+        with self._lock:
+            tenantstats = self._tenant(tenant)
+            tenantstats["seconds"] = seconds
+            tenantstats["status"] = status
+
+    def add_tokens(self, tenant, model, count=1):
+        with self._lock:
+            self.tokens[model] = self.tokens.get(model, 0) + count
+            self._tenant(tenant)["tokens"] += count
+
+    def summary(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in self.endpoints.items():
+                histogram = stats["histogram"]
+                endpoints[endpoint] = {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "retries": stats["retries"],
+                    "seconds_sum": histogram.sum,
+                    "seconds_avg": histogram.sum / histogram.count if histogram.count else 0.0,
+                    "histogram": dict(("le_{}".format(bound), count) for bound, count in histogram.cumulative())
+                }
+
+            statuses = {}
+            for tenantstats in self.tenants.values():
+                status = tenantstats["status"]
+                if status is not None:
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            slowest = sorted(((tenant, stats["seconds"]) for tenant, stats in self.tenants.items()
+                              if stats["seconds"] is not None), key=lambda item: item[1], reverse=True)[:10]
+
+            return {
+                "started": self.started,
+                "duration_seconds": time.time() - self.started,
+                "totals": {
+                    "calls": sum(stats["calls"] for stats in self.endpoints.values()),
+                    "errors": sum(stats["errors"] for stats in self.endpoints.values()),
+                    "retries": sum(stats["retries"] for stats in self.endpoints.values()),
+                    "tokens": sum(self.tokens.values()),
+                    "tenants": statuses
+                },
+                "licenses_consumed": dict(self.tokens),
+                "endpoints": endpoints,
+                "slowest_tenants": [{"tenant_id": tenant, "seconds": seconds} for tenant, seconds in slowest],
+                "tenants": dict((tenant, dict(stats)) for tenant, stats in self.tenants.items())
+            }
+
+    def prometheus(self):
+        """
+        :return: Summary in the Prometheus text exposition format. Tenants are left out to keep label cardinality low.
+        """
+        summary = self.summary()
+        lines = [
+            "# HELP vff_run_duration_seconds Duration of the token run",
+            "# TYPE vff_run_duration_seconds gauge",
+            "vff_run_duration_seconds {}".format(summary["duration_seconds"]),
+            "# HELP vff_calls_total Controller calls by endpoint",
+            "# TYPE vff_calls_total counter",
+        ]
+        for endpoint, stats in sorted(summary["endpoints"].items()):
+            lines.append('vff_calls_total{{endpoint="{}"}} {}'.format(endpoint, stats["calls"]))
+        lines += ["# HELP vff_call_errors_total Failed controller calls by endpoint",
+                  "# TYPE vff_call_errors_total counter"]
+        for endpoint, stats in sorted(summary["endpoints"].items()):
+            lines.append('vff_call_errors_total{{endpoint="{}"}} {}'.format(endpoint, stats["errors"]))
+        lines += ["# HELP vff_call_retries_total Retried controller calls by endpoint",
+                  "# TYPE vff_call_retries_total counter"]
+        for endpoint, stats in sorted(summary["endpoints"].items()):
+            lines.append('vff_call_retries_total{{endpoint="{}"}} {}'.format(endpoint, stats["retries"]))
+
+        lines += ["# HELP vff_call_duration_seconds Controller call latency by endpoint",
+                  "# TYPE vff_call_duration_seconds histogram"]
+        with self._lock:
+            histograms = sorted((endpoint, stats["histogram"]) for endpoint, stats in self.endpoints.items())
+        for endpoint, histogram in histograms:
+            for bound, count in histogram.cumulative():
+                lines.append('vff_call_duration_seconds_bucket{{endpoint="{}",le="{}"}} {}'.format(endpoint, bound, count))
+            lines.append('vff_call_duration_seconds_bucket{{endpoint="{}",le="+Inf"}} {}'.format(endpoint, histogram.count))
+            lines.append('vff_call_duration_seconds_sum{{endpoint="{}"}} {}'.format(endpoint, histogram.sum))
+            lines.append('vff_call_duration_seconds_count{{endpoint="{}"}} {}'.format(endpoint, histogram.count))
+
+        lines += ["# HELP vff_licenses_consumed_total Tokens created by model",
+                  "# TYPE vff_licenses_consumed_total counter"]
+        for model, count in sorted(summary["licenses_consumed"].items()):
+            lines.append('vff_licenses_consumed_total{{model="{}"}} {}'.format(model, count))
+        lines += ["# HELP vff_tenants_total Tenants processed by status",
+                  "# TYPE vff_tenants_total counter"]
+        for status, count in sorted(summary["totals"]["tenants"].items()):
+            lines.append('vff_tenants_total{{status="{}"}} {}'.format(status, count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix):
+        """
+        Write <prefix>.json and <prefix>.prom. Each file is replaced atomically, as a textfile collector expects.
+        :return: List of files written
+        """
+        files = []
+        for filename, content in [("{}.json".format(prefix), json.dumps(self.summary(), indent=2)),
+                                  ("{}.prom".format(prefix), self.prometheus())]:
+            tmpname = "{}.tmp".format(filename)
+            with open(tmpname, "w") as f:
+                f.write(content)
+            os.replace(tmpname, filename)
+            files.append(filename)
+        return files
@@ -0,0 +1,321 @@
+"""
+Reusable VFF token minting API
+"""
+import collections
+import threading
+import time
+
+from .authcache import EXPIRY_MARGIN, login_secret, session_expires_in
+from .connpool import share_connections
+from .inventory import STATUS_WORKERS, get_license_usage
+from .profiling import NO_PROFILE
+from .ratelimit import DIRECT, POST_RETRY_STATUSES
+from .workers import run_bounded
+
+MODEL_MAP = {
+    "3102": "ion 3102v",
+    "3104": "ion 3104v",
+    "3108": "ion 3108v",
+    "7108": "ion 7108v",
+    "7116": "ion 7116v",
+    "7132": "ion 7132v"
+}
+
+# Sessions are logged in again after this many seconds, before the access token expires
+SESSION_TTL = 600
+
+# Token requests in flight at a time for one tenant and model
+INFLIGHT = 8
+
+Token = collections.namedtuple("Token", ["tenant_id", "model", "index", "key", "secret", "multiuse"])
+
+
+def ion_model(model_name):
+    """
+    :return: ION model as reported by vfflicenses, ex. 3102 -> ion 3102v. Full names are returned unchanged.
+    """
+    return MODEL_MAP.get(str(model_name), model_name)
+
+
+class MintResult(object):
+    """
+    Outcome of a TokenMinter.mint() call.
+    status is one of: ok, partial (fewer tokens than requested), skipped (not enough licenses or nothing to do)
+    or failed (login failure or no token created).
+    failures holds the SDK responses of failed token requests.
+    """
+
+    def __init__(self, tenant_id, model, requested):
+        self.tenant_id = tenant_id
+        self.model = model
+        self.requested = requested
+        self.available = None
+        self.tokens = []
+        self.errors = []
+        self.failures = []
+        self.status = None
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def __repr__(self):
+        return "<MintResult {} {} {}/{} {}>".format(self.tenant_id, self.model, len(self.tokens), self.requested,
+                                                    self.status)
+
+
+class TokenMinter(object):
+    """
+    Creates VFF tokens for one or more tenants.
+    An authenticated SDK session and a license inventory are held per tenant, so state never carries over from one
+    tenant to another. Licenses used by tokens created since the inventory was read are subtracted from the
+    available count. Results are returned instead of printed.
+    Safe to share across threads. Calls for the same tenant are serialized, except the token requests of one
+    mint(), which are pipelined.
+    """
+
+    def __init__(self, session_factory, scheduler=None, metrics=None, status_workers=STATUS_WORKERS,
+                 session_ttl=SESSION_TTL, inflight=INFLIGHT, profiler=None):
+        """
+        :param session_factory: Callable taking a tenant ID and returning an authenticated SDK session, or None
+                                if login failed
+        :param scheduler: CallScheduler for all controller calls
+        :param metrics: Metrics to count tokens created
+        :param session_ttl: Seconds before a session is replaced by a new login. None to keep sessions. A session
+                            is replaced sooner if its access token expires first
+        :param inflight: Token requests in flight at a time within one mint()
+        :param profiler: Profiler recording spans for tenant login, get_license_usage and mint
+        """
+        self.session_factory = session_factory
+        self.scheduler = scheduler or DIRECT
+        self.metrics = metrics
+        self.status_workers = status_workers
+        self.session_ttl = session_ttl
+        self.inflight = max(1, inflight)
+        self.profiler = profiler or NO_PROFILE
+        self._sessions = {}
+        self._inventories = {}
+        self._minted = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_service_account(cls, sdk_module, controller, client_id, client_secret, authcache=None, adapter=None,
+                            **kwargs):
+        """
+        Minter that logs in to each tenant (child TSG) with Service Account credentials.
+        :param sdk_module: The prisma_sase module
+        :param adapter: Shared HTTPAdapter from shared_adapter(), mounted on every tenant session
+        """
+        scheduler = kwargs.get("scheduler", None)
+
+        def session_factory(tenant):
+            sdk = sdk_module.API(controller=controller, ssl_verify=False)
+            share_connections(sdk, adapter)
+            if not login_secret(sdk, client_id, client_secret, tenant, cache=authcache, scheduler=scheduler):
+                return None
+            return sdk
+
+        return cls(session_factory, **kwargs)
+
+    @classmethod
+    def for_session(cls, sdk, **kwargs):
+        """
+        Minter for the single tenant of an already authenticated session
+        """
+        def session_factory(tenant):
+            return sdk if tenant == sdk.tenant_id else None
+
+        kwargs.setdefault("session_ttl", None)
+        return cls(session_factory, **kwargs)
+
+    def _tenant_lock(self, tenant):
+        with self._lock:
+            return self._locks.setdefault(tenant, threading.RLock())
+
+    def session(self, tenant):
+        """
+        :return: Authenticated SDK session for the tenant, or None if login failed
+        """
+        with self._tenant_lock(tenant):
+            entry = self._sessions.get(tenant, None)
+            if entry is not None and (entry[1] is None or time.monotonic() < entry[1]):
+                return entry[0]
+
+            with self.profiler.span("tenant_login", tenant=tenant):
+                sdk = self.session_factory(tenant)
+            if sdk is None:
+                self._sessions.pop(tenant, None)
+                return None
+
+            #
+            # A session logged in with a cached access token may have less than session_ttl left
+            #
+            ttl = self.session_ttl
+            expires_in = session_expires_in(sdk)
+            if expires_in is not None:
+                ttl = expires_in - EXPIRY_MARGIN if ttl is None else min(ttl, expires_in - EXPIRY_MARGIN)
+            self._sessions[tenant] = (sdk, None if ttl is None else time.monotonic() + ttl)
+            return sdk
+
+    def inventory(self, tenant, refresh=False):
+        """
+        :return: LicenseInventory for the tenant, read once and cached until refresh. None if login failed.
+                 Its failed flag is set if the licenses could not be listed.
+        """
+        with self._tenant_lock(tenant):
+            if not refresh and tenant in self._inventories:
+                return self._inventories[tenant]
+
+            sdk = self.session(tenant)
+            if sdk is None:
+                return None
+            with self.profiler.span("get_license_usage", tenant=tenant):
+                inventory = get_license_usage(sdk, max_workers=self.status_workers, scheduler=self.scheduler)
+            self._inventories[tenant] = inventory
+            self._minted.pop(tenant, None)
+            return inventory
+
+    def available(self, tenant, model):
+        """
+        :return: Licenses available for the model, less tokens created since the inventory was read
+        """
+        model = ion_model(model)
+        with self._tenant_lock(tenant):
+            inventory = self.inventory(tenant)
+            if inventory is None:
+                return 0
+            return inventory.available(model) - self._minted.get(tenant, {}).get(model, 0)
+
+    def release(self, tenant):
+        """
+        Drop the cached session and inventory of a tenant
+        """
+        with self._tenant_lock(tenant):
+            self._sessions.pop(tenant, None)
+            self._inventories.pop(tenant, None)
+            self._minted.pop(tenant, None)
+        with self._lock:
+            self._locks.pop(tenant, None)
+
+    def mint(self, tenant, model, count=1, multiuse=False, indexes=None, on_token=None, inflight=None):
+        """
+        Create VFF tokens for a model on a tenant, if enough licenses are available for all of them.
+        Token requests are pipelined. Requests in flight never exceed the licenses left for the model.
+        :param model: ION model, ex. 3102 or ion 3102v
+        :param count: Number of tokens
+        :param multiuse: True for multi use tokens
+        :param indexes: Token indexes to create, used to resume a batch. Default: range(count)
+        :param on_token: Called with each Token as soon as it is created, from the calling thread. If it raises,
+                         the tokens already requested are still passed to it before the first error is raised
+        :param inflight: Token requests in flight at a time. Default: the minter's inflight
+        :return: MintResult
+        """
+        model = ion_model(model)
+        indexes = list(range(count)) if indexes is None else list(indexes)
+        result = MintResult(tenant, model, len(indexes))
+        if not indexes:
+            result.status = "skipped"
+            return result
+
+        with self._tenant_lock(tenant):
+            sdk = self.session(tenant)
+            if sdk is None:
+                result.errors.append("Service Account login failure for tenant: {}".format(tenant))
+                result.status = "failed"
+                return result
+
+            inventory = self.inventory(tenant)
+            if inventory is None or inventory.failed:
+                result.errors.append("Could not retrieve VFF Licenses for tenant: {}".format(tenant))
+                result.status = "failed"
+                return result
+            if inventory.status_failed(model):
+                result.errors.append("Could not retrieve VFF License Status for {} on tenant: {}".format(model, tenant))
+                result.status = "failed"
+                return result
+
+            result.available = self.available(tenant, model)
+            if result.available < len(indexes):
+                result.errors.append("Not enough licenses available to generate {} tokens for {}. Available: {}".format(
+                    len(indexes), model, result.available))
+                result.status = "skipped"
+                return result
+
+            license_id = self._inventories[tenant].license_id(model)
+            data = {
+                "is_multiuse": "true" if multiuse in [True, "true"] else "false",
+                "vfflicense_id": None,
+                "ion_key": None,
+                "valid_till_secs": 0,
+                "is_revoked": False,
+                "secret_key": None,
+                "is_used": False,
+                "is_expired": False
+            }
+
+            def post(index):
+                return self.scheduler.call(sdk.post.tokens_vfflicenses, vfflicense_id=license_id, data=data,
+                                           retry_statuses=POST_RETRY_STATUSES, endpoint="tokens_vfflicenses",
+                                           tenant=tenant)
+
+            #
+            # A token request that raises is recorded and the rest are still read, as every response in flight may
+            # hold a token that already uses a license. If on_token raises, no more requests are sent, the tokens
+            # in flight are still passed to on_token and the first error is raised once they all have been.
+            #
+            raised = []
+
+            def submit():
+                for index in indexes:
+                    if raised:
+                        return
+                    yield index
+
+            #
+            # Every index is submitted once and all of them fit in the available count, so the requests in flight
+            # plus the tokens created can never exceed the licenses left
+            #
+            width = min(inflight or self.inflight, len(indexes), result.available)
+            with self.profiler.span("mint", tenant=tenant, model=model, count=len(indexes)):
+                for index, future in run_bounded(post, submit(), width, max_pending=width):
+                    try:
+                        resp = future.result()
+                    except Exception as e:
+                        result.errors.append("Could not create VFF token for {}. Error: {}".format(model, e))
+                        continue
+                    if not resp.cgx_status:
+                        result.errors.append("Could not create VFF token for {}. Status: {}".format(
+                            model, getattr(resp, "status_code", None)))
+                        result.failures.append(resp)
+                        continue
+
+                    tokendata = resp.cgx_content or {}
+                    if not tokendata.get("ion_key", None):
+                        result.errors.append("Could not read VFF token for {} from the response".format(model))
+                        result.failures.append(resp)
+                        continue
+
+                    token = Token(tenant_id=tenant, model=model, index=index, key=tokendata["ion_key"],
+                                  secret=tokendata.get("secret_key", None), multiuse=data["is_multiuse"] == "true")
+                    minted = self._minted.setdefault(tenant, {})
+                    minted[model] = minted.get(model, 0) + 1
+                    if self.metrics is not None:
+                        self.metrics.add_tokens(tenant, model)
+                    result.tokens.append(token)
+                    if on_token is not None:
+                        try:
+                            on_token(token)
+                        except Exception as e:
+                            raised.append(e)
+
+            if raised:
+                raise raised[0]
+
+        if len(result.tokens) == len(indexes):
+            result.status = "ok"
+        elif result.tokens:
+            result.status = "partial"
+        else:
+            result.status = "failed"
+        return result
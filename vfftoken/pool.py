@@ -0,0 +1,222 @@
+"""
+Pre-minted VFF token pool and local HTTP endpoint
+"""
+import collections
+import hmac
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+
+from .minter import Token, ion_model
+
+
+class TokenPool(object):
+    """
+    Keeps a pool of pre-minted tokens per (tenant, model).
+    A background thread refills a pool to high_watermark when it drops below low_watermark. The license inventory
+    is read again for each refill, and refills never exceed allowed_ions - deployed_ions as reported by
+    vfflicense_status, less the tokens already pooled.
+    Tokens are held in memory. store, a TokenStore, keeps each token minted, with its secret encrypted, until it is
+    issued, and the token is then removed from it. On a restart, restore() puts the tokens left in the store back
+    in their pools, so they are not orphaned and minted again.
+    """
+
+    def __init__(self, minter, multiuse=False, low_watermark=5, high_watermark=20, store=None, retry_interval=30):
+        self.minter = minter
+        self.multiuse = multiuse
+        self.low_watermark = low_watermark
+        self.high_watermark = max(low_watermark, high_watermark)
+        self.store = store
+        self.retry_interval = retry_interval
+        self.issued = 0
+        self.errors = collections.deque(maxlen=20)
+        self._pools = collections.OrderedDict()
+        self._blocked = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def add_target(self, tenant, model):
+        with self._cond:
+            self._pools.setdefault((tenant, ion_model(model)), collections.deque())
+            self._cond.notify_all()
+
+    def size(self, tenant, model):
+        with self._cond:
+            pool = self._pools.get((tenant, ion_model(model)), None)
+            return len(pool) if pool is not None else 0
+
+    def take(self, tenant, model):
+        """
+        :return: A pre-minted Token, or None if the pool for (tenant, model) is empty or not configured
+        """
+        key = (tenant, ion_model(model))
+        with self._cond:
+            pool = self._pools.get(key, None)
+            if not pool:
+                self._cond.notify_all()
+                return None
+            token = pool.popleft()
+            self.issued += 1
+            if self.store is not None:
+                # Removed before the token is handed out, so a crash can lose it but never issue it twice
+                self.store.remove(token.key)
+            if len(pool) < self.low_watermark:
+                self._cond.notify_all()
+            return token
+
+    def restore(self, rows):
+        """
+        Put back the tokens of an earlier run that were minted but not issued, read from its store.
+        Only tokens for configured pools and of this pool's use are restored. The others are left in the store.
+        :param rows: Iterable of token dicts with secrets, as returned by TokenStore.query(secrets=True)
+        :return: Number of tokens restored
+        """
+        use = "multi" if self.multiuse else "single"
+        count = 0
+        with self._cond:
+            for row in rows:
+                pool = self._pools.get((row["tenant_id"], ion_model(row["model"])), None)
+                if pool is None or row.get("use") != use:
+                    continue
+                pool.append(Token(tenant_id=row["tenant_id"], model=ion_model(row["model"]), index=None,
+                                  key=row["key"], secret=row["secret"], multiuse=self.multiuse))
+                count += 1
+            self._cond.notify_all()
+        return count
+
+    def status(self):
+        """
+        :return: Pool sizes and counters. Contains no secrets.
+        """
+        with self._cond:
+            return {
+                "pools": [{"tenant_id": tenant, "model": model, "size": len(pool)}
+                          for (tenant, model), pool in self._pools.items()],
+                "low_watermark": self.low_watermark,
+                "high_watermark": self.high_watermark,
+                "issued": self.issued,
+                "errors": list(self.errors)
+            }
+
+    def _needs_refill(self):
+        now = time.monotonic()
+        return [key for key, pool in self._pools.items()
+                if len(pool) < self.low_watermark and self._blocked.get(key, 0) <= now]
+
+    def refill(self, tenant, model):
+        """
+        Mint tokens to bring the pool for (tenant, model) up to high_watermark, within available licenses.
+        :return: Number of tokens added
+        """
+        key = (tenant, model)
+        inventory = self.minter.inventory(tenant, refresh=True)
+        if inventory is None or inventory.failed or inventory.status_failed(model):
+            self._blocked[key] = time.monotonic() + self.retry_interval
+            self.errors.append("Could not retrieve VFF Licenses to refill {} on tenant: {}".format(model, tenant))
+            return 0
+        with self._cond:
+            pooled = len(self._pools[key])
+        count = min(self.high_watermark - pooled, self.minter.available(tenant, model) - pooled)
+        if count <= 0:
+            self._blocked[key] = time.monotonic() + self.retry_interval
+            self.errors.append("No licenses available to refill {} on tenant: {}".format(model, tenant))
+            return 0
+
+        def save(token):
+            if self.store is not None:
+                self.store.write({"tenant_id": token.tenant_id, "model": token.model,
+                                  "use": "multi" if token.multiuse else "single",
+                                  "key": token.key, "secret": token.secret})
+            with self._cond:
+                self._pools[key].append(token)
+
+        result = self.minter.mint(tenant, model, count=count, multiuse=self.multiuse, on_token=save)
+        if not result.tokens:
+            self._blocked[key] = time.monotonic() + self.retry_interval
+        for error in result.errors:
+            self.errors.append("{}. Tenant: {}".format(error, tenant))
+        return len(result.tokens)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._needs_refill():
+                    self._cond.wait(timeout=self.retry_interval)
+                if self._stopping:
+                    return
+                keys = self._needs_refill()
+
+            for tenant, model in keys:
+                try:
+                    self.refill(tenant, model)
+                except Exception as e:
+                    self._blocked[(tenant, model)] = time.monotonic() + self.retry_interval
+                    self.errors.append("Refill failed for {} on tenant: {}. {}".format(model, tenant, e))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="vff-pool-refill")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def make_server(pool, host="127.0.0.1", port=8640, auth_token=None):
+    """
+    HTTP server handing out pooled tokens.
+    GET /token?tenant_id=<tsg_id>&model=<model> returns a token as JSON, or 503 if the pool is empty.
+    GET /status returns pool sizes.
+    If auth_token is set, requests must send it in the X-Auth-Token header.
+    :return: Server. Call serve_forever() to run it.
+    """
+    # http.server loads email and http.client, about 30 ms that only serve needs
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def _send(self, status, content):
+            body = json.dumps(content).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if auth_token and not hmac.compare_digest(self.headers.get("X-Auth-Token", ""), auth_token):
+                return self._send(401, {"error": "Unauthorized"})
+
+            url = urllib.parse.urlparse(self.path)
+            query = dict((name, values[0]) for name, values in urllib.parse.parse_qs(url.query).items())
+            if url.path == "/status":
+                return self._send(200, pool.status())
+
+            if url.path == "/token":
+                if "tenant_id" not in query or "model" not in query:
+                    return self._send(400, {"error": "tenant_id and model are required"})
+                token = pool.take(query["tenant_id"], query["model"])
+                if token is None:
+                    return self._send(503, {"error": "No token available for {} on tenant: {}".format(
+                        query["model"], query["tenant_id"])})
+                return self._send(200, {"tenant_id": token.tenant_id, "model": token.model,
+                                        "key": token.key, "secret": token.secret})
+
+            return self._send(404, {"error": "Not found"})
+
+        def log_message(self, format, *args):
+            # Keep request lines, which never contain secrets, out of stderr noise
+            pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        daemon_threads = True
+
+    return Server((host, port), Handler)
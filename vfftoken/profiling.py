@@ -0,0 +1,155 @@
+"""
+cProfile and wall-clock span tracing of script phases
+"""
+import cProfile
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Profiler(object):
+    """
+    Records wall-clock spans of named phases from any thread, and runs cProfile while started.
+    write() saves <prefix>.prof, loadable with pstats, snakeviz or flameprof, and <prefix>.trace.json in the
+    Chrome trace event format, loadable with chrome://tracing, Perfetto or speedscope.
+    Before Python 3.12 cProfile only sees the thread that enabled it, so each worker thread started while
+    profiling gets its own profiler and the results are combined.
+    """
+
+    def __init__(self, origin=None):
+        """
+        :param origin: time.perf_counter() value that trace timestamps are relative to. Default: now
+        """
+        self.origin = origin if origin is not None else time.perf_counter()
+        self._spans = []
+        self._profiles = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._profile = None
+
+    def start(self):
+        self._profile = cProfile.Profile()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread)
+        self._profile.enable()
+
+    def _start_thread(self, frame, event, arg):
+        """
+        Profile function installed by threading in each new thread. Replaces itself with a cProfile profiler.
+        """
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            sys.setprofile(None)
+
+    def stop(self):
+        if self._profile is None:
+            return
+        self._profile.disable()
+        threading.setprofile(None)
+
+    def add_span(self, name, start, end, **args):
+        """
+        Record a span that has already ended
+        :param start: time.perf_counter() at the start of the span
+        :param end: time.perf_counter() at the end of the span
+        """
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            self._spans.append((name, start, end, thread.ident, args))
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """
+        Context manager recording the wall-clock time of a phase. args are shown with the span in trace viewers.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter(), **args)
+
+    def phases(self):
+        """
+        :return: Dict of span name to (count, total seconds)
+        """
+        totals = {}
+        with self._lock:
+            for name, start, end, _, _ in self._spans:
+                count, seconds = totals.get(name, (0, 0.0))
+                totals[name] = (count + 1, seconds + end - start)
+        return totals
+
+    def trace_events(self):
+        """
+        :return: Spans as Chrome trace events, with microsecond timestamps relative to origin
+        """
+        pid = os.getpid()
+        with self._lock:
+            tids = dict((ident, index + 1) for index, ident in enumerate(self._threads))
+            events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tids[ident], "args": {"name": name}}
+                      for ident, name in self._threads.items()]
+            for name, start, end, ident, args in self._spans:
+                events.append({
+                    "name": name,
+                    "cat": "phase",
+                    "ph": "X",
+                    "ts": round((start - self.origin) * 1e6, 3),
+                    "dur": round((end - start) * 1e6, 3),
+                    "pid": pid,
+                    "tid": tids[ident],
+                    "args": dict((key, str(value)) for key, value in args.items())
+                })
+        return events
+
+    def write(self, prefix):
+        """
+        Stop profiling and write <prefix>.prof and <prefix>.trace.json
+        :return: List of files written
+        """
+        # pstats costs about 10 ms to import and is only needed with --profile
+        import pstats
+
+        self.stop()
+        files = []
+        if self._profile is not None:
+            stats = pstats.Stats(self._profile)
+            for profile in list(self._profiles):
+                try:
+                    stats.add(profile)
+                except TypeError:
+                    # A thread that never called a function has no stats
+                    continue
+            stats.dump_stats("{}.prof".format(prefix))
+            files.append("{}.prof".format(prefix))
+
+        tracefilename = "{}.trace.json".format(prefix)
+        tmpfilename = "{}.tmp".format(tracefilename)
+        with open(tmpfilename, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        os.replace(tmpfilename, tracefilename)
+        files.append(tracefilename)
+        return files
+
+
+class NullProfiler(object):
+    """
+    Profiler that records nothing, used when profiling is off
+    """
+
+    def add_span(self, name, start, end, **args):
+        pass
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        yield
+
+
+NO_PROFILE = NullProfiler()
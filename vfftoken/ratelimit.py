@@ -0,0 +1,174 @@
+"""
+Rate limiting and retry for controller calls
+"""
+import random
+import threading
+import time
+
+# Responses retried for read calls
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Responses retried for token creation. Only statuses where the controller did not act on the request,
+# so a retry cannot create a duplicate token.
+POST_RETRY_STATUSES = (429, 503)
+
+
+class TokenBucket(object):
+    """
+    Allows up to rate calls per second on average, with bursts of up to burst calls.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CallScheduler(object):
+    """
+    Shared scheduler for SDK calls across all worker threads.
+    - Calls are paced by a token bucket when rate is set.
+    - Responses with a retryable status, and connection errors, are retried with jittered exponential backoff.
+    - The number of calls in flight is limited. The limit is halved, at most once per second, when a call is
+      throttled or fails with 5xx, and raised by one after a run of successful calls equal to the current limit.
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=16, min_concurrency=1, max_retries=5,
+                 base_delay=0.5, max_delay=30.0, metrics=None):
+        self.metrics = metrics
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limit = max_concurrency
+        self.retries = 0
+        self._inflight = 0
+        self._successes = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while self._inflight >= self.limit:
+                self._cond.wait()
+            self._inflight += 1
+
+    def _release(self, ok):
+        with self._cond:
+            self._inflight -= 1
+            if ok:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            else:
+                self._successes = 0
+                now = time.monotonic()
+                if now - self._last_decrease >= 1:
+                    self.limit = max(self.min_concurrency, self.limit // 2)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+    def backoff(self, attempt, resp=None):
+        """
+        :return: Seconds to wait before the next attempt. Retry-After is honoured when the controller sends it.
+        """
+        headers = getattr(resp, "headers", None) or {}
+        retry_after = headers.get("Retry-After", None)
+        if retry_after is not None:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call an SDK function, retrying throttled and failed attempts.
+        :param retry_statuses: Keyword only. HTTP status codes to retry. Default: RETRY_STATUSES
+        :param retry_if: Keyword only. Predicate on the result to retry calls that do not return a response,
+                         such as login_secret
+        :param max_retries: Keyword only. Override the scheduler's retry count for this call
+        :param endpoint: Keyword only. Name recorded in metrics. Default: the function name
+        :param tenant: Keyword only. Tenant recorded in metrics
+        :return: Result of the last attempt
+        """
+        retry_statuses = kwargs.pop("retry_statuses", RETRY_STATUSES)
+        retry_if = kwargs.pop("retry_if", None)
+        max_retries = kwargs.pop("max_retries", self.max_retries)
+        endpoint = kwargs.pop("endpoint", None) or getattr(func, "__name__", "call")
+        tenant = kwargs.pop("tenant", None)
+
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self._acquire()
+            resp = None
+            start = time.monotonic()
+            try:
+                resp = func(*args, **kwargs)
+            except (IOError, OSError):
+                self._release(ok=False)
+                self._observe(endpoint, tenant, start, False, attempt)
+                if attempt >= max_retries:
+                    raise
+            except BaseException:
+                self._release(ok=False)
+                self._observe(endpoint, tenant, start, False, attempt)
+                raise
+            else:
+                status = getattr(resp, "status_code", None)
+                try:
+                    retry = status in retry_statuses or (retry_if is not None and retry_if(resp))
+                except BaseException:
+                    self._release(ok=False)
+                    raise
+                # Any 5xx lowers the limit, including on calls that are not retried, such as token creation
+                throttled = status == 429 or (isinstance(status, int) and 500 <= status < 600)
+                self._release(ok=not retry and not throttled)
+                self._observe(endpoint, tenant, start, not retry and getattr(resp, "cgx_status", True) is not False,
+                              attempt)
+                if not retry or attempt >= max_retries:
+                    return resp
+
+            time.sleep(self.backoff(attempt, resp))
+            attempt += 1
+            with self._cond:
+                self.retries += 1
+
+    def _observe(self, endpoint, tenant, start, ok, attempt):
+        if self.metrics is not None:
+            self.metrics.observe_call(endpoint, tenant, time.monotonic() - start, ok, retry=attempt > 0)
+
+
+class DirectScheduler(object):
+    """
+    Scheduler that calls straight through, used when no CallScheduler is configured.
+    """
+
+    def call(self, func, *args, **kwargs):
+        kwargs.pop("retry_statuses", None)
+        kwargs.pop("retry_if", None)
+        kwargs.pop("max_retries", None)
+        kwargs.pop("endpoint", None)
+        kwargs.pop("tenant", None)
+        return func(*args, **kwargs)
+
+
+DIRECT = DirectScheduler()
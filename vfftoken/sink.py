@@ -0,0 +1,194 @@
+"""
+Streaming output of generated VFF tokens
+"""
+import csv
+import json
+import os
+import threading
+
+TOKEN_FIELDS = ["tenant_id", "model", "use", "key", "secret"]
+FORMATS = ["csv", "jsonl", "parquet"]
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH = 1000
+
+
+def output_format(filename, format=None):
+    """
+    :return: format if given, else jsonl for .jsonl/.json files, parquet for .parquet files and csv otherwise
+    """
+    if format:
+        return format
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in [".jsonl", ".json"]:
+        return "jsonl"
+    if extension == ".parquet":
+        return "parquet"
+    return "csv"
+
+
+def ends_line(filename):
+    """
+    :return: True if the file is empty or its last line is complete
+    """
+    with open(filename, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class TokenSink(object):
+    """
+    Thread safe writer that appends and flushes each row as soon as it is written.
+    Rows go to <filename>.partial, which is renamed to filename on close. If the run
+    dies, the tokens created so far are left in the .partial file.
+    The file is created readable only by the owner, as it holds secrets.
+    With append, rows are added to those of an earlier run, whether it completed (filename) or
+    crashed (<filename>.partial), so a resumed run keeps the secrets already written.
+    Parquet output needs pyarrow. Its rows are written in row groups of PARQUET_BATCH, so the .partial file
+    of a failed run is not readable as Parquet.
+    """
+
+    def __init__(self, filename, fields=TOKEN_FIELDS, format=None, types=None, append=False):
+        """
+        :param types: Dict of field to Parquet column type (ex. int64). Other fields are strings
+        :param append: Add to the rows left in filename or <filename>.partial instead of replacing them.
+                       Not supported for Parquet
+        """
+        self.filename = filename
+        self.partial_filename = "{}.partial".format(filename)
+        self.fields = list(fields)
+        self.format = output_format(filename, format)
+        if self.format not in FORMATS:
+            raise ValueError("Unsupported output format: {}".format(self.format))
+
+        if append and self.format == "parquet":
+            raise ValueError("Cannot append to Parquet output: {}".format(filename))
+
+        self._schema = None
+        if self.format == "parquet":
+            try:
+                # Optional dependency, only needed for Parquet output
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ValueError("Parquet output requires the 'pyarrow' python module (try 'pip install pyarrow')")
+            types = types or {}
+            self._schema = pyarrow.schema([(field, getattr(pyarrow, types.get(field, "string"))())
+                                           for field in self.fields])
+
+        self.count = 0
+        self._lock = threading.Lock()
+        self._rows = []
+        header = True
+        if append:
+            #
+            # The output of a completed run is moved back to .partial and renamed again on close
+            #
+            if os.path.exists(filename):
+                if os.path.exists(self.partial_filename):
+                    raise ValueError("Both {} and {} exist. Please merge them into one file before resuming".format(
+                        filename, self.partial_filename))
+                os.replace(filename, self.partial_filename)
+            header = not os.path.exists(self.partial_filename) or os.path.getsize(self.partial_filename) == 0
+            if not header and self.format == "csv":
+                # Keep the columns of the earlier run, which may predate a column
+                with open(self.partial_filename, "r", newline="") as f:
+                    self.fields = next(csv.reader(f), None) or self.fields
+            fd = os.open(self.partial_filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        else:
+            fd = os.open(self.partial_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self._writer = None
+        if self._schema is not None:
+            self._file = os.fdopen(fd, "wb")
+            self._writer = pyarrow.parquet.ParquetWriter(self._file, self._schema)
+        else:
+            self._file = os.fdopen(fd, "a" if append else "w", newline="")
+            if not header and not ends_line(self.partial_filename):
+                # Complete the line a crashed run was writing, so it does not run into the next row
+                self._file.write("\n")
+            if self.format == "csv":
+                self._writer = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction="ignore")
+                if header:
+                    self._writer.writeheader()
+            self._file.flush()
+
+    def write(self, row):
+        with self._lock:
+            if self._schema is not None:
+                self._rows.append(row)
+                if len(self._rows) >= PARQUET_BATCH:
+                    self._write_rows()
+                self.count += 1
+                return
+            if self._writer is not None:
+                self._writer.writerow(row)
+            else:
+                self._file.write(json.dumps(dict((field, row.get(field)) for field in self.fields)) + "\n")
+            self._file.flush()
+            self.count += 1
+
+    def _write_rows(self):
+        """
+        Write the buffered rows as one Parquet row group
+        """
+        import pyarrow
+
+        columns = dict((field, [row.get(field) for row in self._rows]) for field in self.fields)
+        self._writer.write_table(pyarrow.Table.from_pydict(columns, schema=self._schema))
+        self._rows = []
+
+    def close(self, commit=True):
+        """
+        Sync and close the file. With commit, the .partial file is atomically renamed to filename.
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._schema is not None:
+                if self._rows:
+                    self._write_rows()
+                self._writer.close()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if commit:
+                os.replace(self.partial_filename, self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leave the .partial file in place if the run failed
+        self.close(commit=exc_type is None)
+        return False
+
+
+class MultiSink(object):
+    """
+    Write each row to several sinks, ex. a TokenSink and a TokenStore
+    """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    @property
+    def count(self):
+        return max([sink.count for sink in self.sinks] or [0])
+
+    def write(self, row):
+        for sink in self.sinks:
+            sink.write(row)
+
+    def close(self, commit=True):
+        for sink in self.sinks:
+            sink.close(commit=commit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+        return False
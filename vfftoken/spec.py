@@ -0,0 +1,56 @@
+"""
+Spec file for multi-model token batches
+"""
+import collections
+import csv
+
+SPEC_COLUMNS = ["tsg_id", "model", "count", "use"]
+
+SpecRow = collections.namedtuple("SpecRow", ["model", "count", "use"])
+
+
+def read_spec(filename, allowed_models=None):
+    """
+    Read a spec CSV with the columns tsg_id, model, count and use, and group the rows by tenant.
+    Rows repeating the same (tsg_id, model, use) are merged by adding their counts.
+    :param allowed_models: Model names accepted in the model column. None to accept any
+    :return: OrderedDict of tsg_id to a list of SpecRow, in file order
+    """
+    spec = collections.OrderedDict()
+    with open(filename, "r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        header = [name.strip() for name in reader.fieldnames or []]
+        missing = [column for column in SPEC_COLUMNS if column not in header]
+        if missing:
+            raise ValueError("Invalid spec. Please provide a CSV file with the column headers: {}".format(
+                ", ".join(SPEC_COLUMNS)))
+        reader.fieldnames = header
+
+        for line, row in enumerate(reader, start=2):
+            tsg_id = (row["tsg_id"] or "").strip()
+            model = (row["model"] or "").strip()
+            use = (row["use"] or "").strip().lower()
+            if not tsg_id:
+                continue
+            if allowed_models is not None and model not in allowed_models:
+                raise ValueError("Invalid model {} on line {}. Please choose from: {}".format(
+                    model, line, ", ".join(allowed_models)))
+            if use not in ["single", "multi"]:
+                raise ValueError("Invalid use {} on line {}. Please choose: single or multi".format(use, line))
+            try:
+                count = int(row["count"])
+            except (TypeError, ValueError):
+                count = 0
+            if count < 1:
+                raise ValueError("Invalid count {} on line {}. Please provide a value of 1 or more".format(
+                    row["count"], line))
+
+            rows = spec.setdefault(tsg_id, [])
+            for index, existing in enumerate(rows):
+                if existing.model == model and existing.use == use:
+                    rows[index] = existing._replace(count=existing.count + count)
+                    break
+            else:
+                rows.append(SpecRow(model=model, count=count, use=use))
+
+    return spec
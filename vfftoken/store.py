@@ -0,0 +1,189 @@
+"""
+Indexed SQLite store of generated VFF tokens
+"""
+import datetime
+import os
+import sqlite3
+import threading
+import uuid
+
+# Environment variable holding the Fernet key used to encrypt secrets in the store
+STORE_KEY_ENV = "VFFTOKEN_STORE_KEY"
+
+# Rows fetched at a time by query()
+STORE_BATCH = 500
+
+STORE_FIELDS = ["run_id", "created_at", "tenant_id", "model", "use", "key", "secret"]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS tokens ("
+    "id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, created_at TEXT NOT NULL, tenant_id TEXT NOT NULL, "
+    "model TEXT NOT NULL, use TEXT, key TEXT NOT NULL, secret BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS tokens_tenant_id ON tokens (tenant_id, model)",
+    "CREATE INDEX IF NOT EXISTS tokens_model ON tokens (model)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS tokens_key ON tokens (key)",
+    "CREATE INDEX IF NOT EXISTS tokens_run_id ON tokens (run_id)",
+]
+
+
+def store_cipher(key=None):
+    """
+    Fernet cipher for secrets in the store. Needs the 'cryptography' python module.
+    :param key: Fernet key. Default: the VFFTOKEN_STORE_KEY environment variable
+    :return: Fernet
+    """
+    key = key or os.environ.get(STORE_KEY_ENV, None)
+    if not key:
+        raise ValueError("Please set {} to a Fernet key to encrypt secrets in the token store. "
+                         "Create one with: {}".format(STORE_KEY_ENV, "python -c \"from cryptography.fernet import "
+                                                                     "Fernet; print(Fernet.generate_key().decode())\""))
+    try:
+        # Optional dependency, only needed for the token store
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise ValueError("The token store requires the 'cryptography' python module (try 'pip install cryptography')")
+
+    try:
+        return Fernet(key)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid {}. Please provide a Fernet key".format(STORE_KEY_ENV))
+
+
+def new_run_id():
+    """
+    :return: Run ID, the UTC time the run started and a random suffix, so runs started in the same second differ
+    """
+    return "{}-{}".format(datetime.datetime.utcnow().strftime('%Y-%m-%d-%H-%M-%S'), uuid.uuid4().hex[:8])
+
+
+class TokenStore(object):
+    """
+    Thread safe SQLite store of tokens, usable in place of a TokenSink.
+    Each token is committed as it is written, as its secret exists nowhere else. The database uses write-ahead
+    logging, so a commit is one append to the log. Tokens are indexed by tenant_id, model, key and run, and a key
+    is stored once. Secrets are encrypted with Fernet.
+    The database file is created readable only by the owner.
+    """
+
+    def __init__(self, filename, key=None, batch_size=STORE_BATCH, run_id=None, require_key=True):
+        """
+        :param key: Fernet key. Default: the VFFTOKEN_STORE_KEY environment variable
+        :param batch_size: Rows fetched at a time by query()
+        :param run_id: Recorded with every token written. Default: new_run_id()
+        :param require_key: False to open the store for queries without secrets
+        """
+        self.filename = filename
+        self.batch_size = max(1, batch_size)
+        self.run_id = run_id or new_run_id()
+        self._key = key
+        self._fernet = store_cipher(key) if require_key else None
+
+        if not os.path.exists(filename):
+            os.close(os.open(filename, os.O_WRONLY | os.O_CREAT, 0o600))
+        self.count = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        try:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=FULL")
+            # Removed tokens are overwritten in the database file instead of left in free pages
+            self._db.execute("PRAGMA secure_delete=ON")
+            with self._db:
+                for statement in SCHEMA:
+                    self._db.execute(statement)
+        except sqlite3.DatabaseError as e:
+            self._db.close()
+            raise ValueError("{} is not a token store: {}".format(filename, e))
+
+    def _cipher(self):
+        if self._fernet is None:
+            self._fernet = store_cipher(self._key)
+        return self._fernet
+
+    def write(self, row):
+        """
+        Add a token. row holds tenant_id, model, key, secret and optionally use.
+        A token whose key is already in the store is not written again and is not counted.
+        """
+        secret = self._cipher().encrypt(str(row["secret"]).encode("utf-8"))
+        created_at = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute("INSERT OR IGNORE INTO tokens (run_id, created_at, tenant_id, model, "
+                                          "use, key, secret) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                          (self.run_id, created_at, row["tenant_id"], row["model"],
+                                           row.get("use", None), row["key"], secret))
+            if cursor.rowcount > 0:
+                self.count += 1
+
+    def remove(self, key):
+        """
+        Delete a token and its secret, ex. once a pooled token is handed out
+        :return: True if the token was in the store
+        """
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute("DELETE FROM tokens WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def query(self, tenant_id=None, model=None, key=None, run_id=None, since=None, limit=None, secrets=False):
+        """
+        Find tokens. All filters are optional and combined.
+        :param since: Only tokens created at or after this UTC time, ex. 2024-01-31 or 2024-01-31T10:00:00Z
+        :param secrets: Decrypt and include the secret
+        :return: Generator of dicts with STORE_FIELDS, newest first
+        """
+        clauses = []
+        params = []
+        for column, value in [("tenant_id", tenant_id), ("model", model), ("key", key), ("run_id", run_id)]:
+            if value is not None:
+                clauses.append("{} = ?".format(column))
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+
+        sql = "SELECT run_id, created_at, tenant_id, model, use, key, secret FROM tokens"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        fernet = self._cipher() if secrets else None
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                return
+            for row in rows:
+                token = dict(zip(STORE_FIELDS, row))
+                token["secret"] = None
+                if fernet is not None:
+                    try:
+                        token["secret"] = fernet.decrypt(bytes(row[6])).decode("utf-8")
+                    except Exception:
+                        raise ValueError("Could not decrypt secret of key {}. Please check {}".format(
+                            row[5], STORE_KEY_ENV))
+                yield token
+
+    def close(self, commit=True):
+        """
+        Close the database. The tokens exist on the controller, so they are kept even if the run failed.
+        """
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+        return False
@@ -0,0 +1,110 @@
+"""
+Streaming tenant list ingestion
+"""
+import csv
+import hashlib
+
+from .ratelimit import DIRECT
+
+# Tenancy API listing every TSG below a TSG
+LIST_CHILDREN_URL = "{}/tenancy/v1/tenant_service_groups/{}/operations/list_children?hierarchy=true"
+
+
+class TenantReader(object):
+    """
+    Read TSG IDs from a CSV file one row at a time.
+    The header is validated when the reader is created. Blank and duplicate IDs are skipped
+    as the file is read, so only the set of IDs seen so far is held in memory.
+    """
+
+    def __init__(self, filename, column="tsg_id"):
+        self.filename = filename
+        self.column = column
+        self._file = open(filename, "r", newline="", encoding="utf-8-sig")
+        self._reader = csv.reader(self._file)
+        try:
+            header = next(self._reader)
+        except StopIteration:
+            header = []
+
+        header = [name.strip() for name in header]
+        if column not in header:
+            self._file.close()
+            raise ValueError("Invalid CSV. Please provide a CSV file with the column header: {}".format(column))
+        self._index = header.index(column)
+
+    def __iter__(self):
+        seen = set()
+        try:
+            for row in self._reader:
+                if len(row) <= self._index:
+                    continue
+                tsg_id = row[self._index].strip()
+                if not tsg_id or tsg_id in seen:
+                    continue
+                seen.add(tsg_id)
+                yield tsg_id
+        finally:
+            self._file.close()
+
+    def close(self):
+        self._file.close()
+
+
+def list_children(sdk, tsg_id, scheduler=None):
+    """
+    List the child TSGs of a TSG, including nested children, from the Tenancy API
+    :param sdk: prisma_sase API session logged in to tsg_id
+    :param scheduler: CallScheduler used for the controller call
+    :return: List of child TSG IDs, or None if the call failed
+    """
+    scheduler = scheduler or DIRECT
+    resp = scheduler.call(sdk.rest_call, LIST_CHILDREN_URL.format(sdk.controller, tsg_id), "get",
+                          endpoint="list_children", tenant=tsg_id)
+    if not resp.cgx_status:
+        return None
+
+    tenantlist = []
+    seen = set([tsg_id])
+    pending = list(resp.cgx_content.get("items", None) or [])
+    while pending:
+        item = pending.pop(0)
+        child = str(item.get("id", "")).strip()
+        if child and child not in seen:
+            seen.add(child)
+            tenantlist.append(child)
+        pending.extend(item.get("children", None) or [])
+    return tenantlist
+
+
+def parse_shard(shard):
+    """
+    Parse a shard of the form i/N, where 1 <= i <= N
+    :return: (i, N). Raises ValueError if invalid
+    """
+    try:
+        index, count = [int(part) for part in str(shard).split("/")]
+    except ValueError:
+        raise ValueError("Invalid shard: {}. Please provide i/N, ex. 1/4".format(shard))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError("Invalid shard: {}. Please provide i/N with 1 <= i <= N".format(shard))
+    return index, count
+
+
+def shard_of(tsg_id, count):
+    """
+    Stable shard of a TSG ID, the same on every host and Python version
+    :return: Shard number from 1 to count
+    """
+    digest = hashlib.sha1(str(tsg_id).strip().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def in_shard(tenants, index, count):
+    """
+    Keep the TSG IDs that belong to shard index of count. Reads tenants lazily.
+    :return: Generator of TSG IDs
+    """
+    for tsg_id in tenants:
+        if count == 1 or shard_of(tsg_id, count) == index:
+            yield tsg_id
@@ -0,0 +1,27 @@
+"""
+Bounded thread pool helpers
+"""
+import concurrent.futures
+
+
+def run_bounded(func, items, workers, max_pending=None):
+    """
+    Run func(item) in a thread pool. Items are read lazily so that at most max_pending calls
+    are queued or running at a time, which lets a streaming source feed the pool.
+    :param max_pending: Defaults to twice the number of workers
+    :return: Generator of (item, future) in order of completion
+    """
+    if max_pending is None:
+        max_pending = workers * 2
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for item in items:
+            pending[executor.submit(func, item)] = item
+            if len(pending) >= max_pending:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future
+
+        for future in concurrent.futures.as_completed(list(pending)):
+            yield pending.pop(future), future